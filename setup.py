@@ -25,6 +25,7 @@ if __name__ == "__main__":
         use_pyscaffold=True,
         install_requires=[
             'orgparse',
+            'lxml',
             'hiccup @ git+https://github.com/karlicoss/hiccup.git@v0.5',
         ],
         package_data = {
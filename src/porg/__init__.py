@@ -12,27 +12,46 @@ finally:
     del get_distribution, DistributionNotFound
 
 
+from bisect import bisect_left, bisect_right
+import asyncio
+from collections import OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime, date
+from functools import lru_cache, partial
+from itertools import islice
 import logging
-from itertools import groupby
-from typing import List, Set, Optional, Dict, Union, NoReturn, Tuple
+import os
+from typing import Any, AsyncIterator, FrozenSet, List, Set, Optional, Dict, Union, NoReturn, Tuple, Callable, Iterable, Iterator, NamedTuple, TYPE_CHECKING
 from pathlib import Path
 import re
+import threading
+from time import perf_counter
 import warnings
 
 
 import orgparse # type: ignore
+from lxml import etree # type: ignore
 
 # TODO add py.typed?
 from hiccup import xfind, xfind_all, Hiccup
 from hiccup import IfParentType as IfPType, IfType, IfName
 
+from .query import Pred, _as_datetime
+from .profiling import Profile, _phase, _profiled
+
+if TYPE_CHECKING:
+    from .timeline import Timeline # needs numpy
+    from .search import SearchIndex, SearchResult
+
 
 def get_logger():
     return logging.getLogger('porg')
 
+_ORG_DATESTR = re.compile(r'\[\d{4}-\d{2}-\d{2}.*?\]')
+
 def extract_org_datestr(s: str) -> Optional[str]:
-    match = re.search(r'\[\d{4}-\d{2}-\d{2}.*?\]', s)
+    match = _ORG_DATESTR.search(s)
     if not match:
         return None
     else:
@@ -40,98 +59,723 @@ def extract_org_datestr(s: str) -> Optional[str]:
 
 Dateish = Union[datetime, date]
 
-# TODO allow specifying custom date formats
-def parse_org_date(s: str) -> Dateish:
-    s = s.strip().strip('[]').strip() # just in case
-    for fmt, cl in [
-            ("%Y-%m-%d %a %H:%M", datetime),
-            ("%Y-%m-%d %H:%M", datetime),
-            ("%Y-%m-%d %a", date),
-            ("%Y-%m-%d", date),
-    ]:
+# all of the shapes parse_org_date supports in a single regex. Mirrors what strptime would accept for
+# "%Y-%m-%d %a %H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%d %a" and "%Y-%m-%d" (with english weekday names)
+_ORG_DATE = re.compile(r"""
+(?P<Y>\d\d\d\d)
+-(?P<m>1[0-2]|0[1-9]|[1-9])
+-(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]|\ [1-9])
+(?:\s+(?:mon|tue|wed|thu|fri|sat|sun))?
+(?:\s+(?P<H>2[0-3]|[0-1]\d|\d):(?P<M>[0-5]\d|\d))?
+""", re.VERBOSE | re.IGNORECASE)
+
+# tried with strptime if the string doesn't match any of the standard shapes
+_CUSTOM_DATE_FORMATS: List[Tuple[str, type]] = []
+
+def register_date_format(fmt: str, cls: type=datetime) -> None:
+    assert cls in (datetime, date), cls
+    _CUSTOM_DATE_FORMATS.append((fmt, cls))
+    _parse_org_date.cache_clear()
+
+@lru_cache(maxsize=4096)
+def _parse_org_date(s: str) -> Dateish:
+    m = _ORG_DATE.fullmatch(s)
+    if m is not None:
         try:
-            res = datetime.strptime(s, fmt)
-            if cl == date:
-                return res.date()
+            (Y, mo, d, H, M) = m.group('Y', 'm', 'd', 'H', 'M')
+            if H is None:
+                return date(int(Y), int(mo), int(d))
             else:
-                return res
+                return datetime(int(Y), int(mo), int(d), int(H), int(M))
+        except ValueError: # e.g. 30th of February
+            pass
+    for fmt, cl in _CUSTOM_DATE_FORMATS:
+        try:
+            res = datetime.strptime(s, fmt)
         except ValueError:
             continue
-    else:
-        raise RuntimeError(f"Bad date string {str(s)}")
+        return res.date() if cl == date else res
+    raise RuntimeError(f"Bad date string {str(s)}")
+
+def parse_org_date(s: str) -> Dateish:
+    s = s.strip().strip('[]').strip() # just in case
+    return _parse_org_date(s)
+
+def parse_org_dates(ss: Iterable[str]) -> List[Dateish]:
+    parse = _parse_org_date
+    return [parse(s.strip().strip('[]').strip()) for s in ss]
 
 def _is_separator(ll: str):
     TABLE_SEP = r'\|(\-+\+)*\-+\|'
     return re.match(TABLE_SEP, ll) is not None
 
-def _parse_org_table(lines: List[str]) -> List[Dict[str, str]]:
-    before_first_sep: List[List[str]] = []
-    after_first_sep: List[List[str]] = []
-    cur = before_first_sep
-    for ll in lines:
+def _split_row(line: str) -> List[str]:
+    return [c.strip() for c in line.strip('|').split('|')]
+
+# returns indices of header and data lines
+# header is everything before the first separator (even if there are no rows after it)
+# if there is no separator, or nothing before it, the table has no header and all rows are data
+def _table_layout(lines: List[str]) -> Tuple[List[int], List[int]]:
+    first_sep: Optional[int] = None
+    rows: List[int] = []
+    for i, ll in enumerate(lines):
         if _is_separator(ll):
-            cur = after_first_sep
-            continue
-        cells = ll.strip('|').split('|')
-        cur.append(cells)
-
-    # TODO FIXME not sure how should the column names be treated if there are multiple lines before first separator...
-    cols = before_first_sep[-1] # TODO FIXME is a table required to have column names at all?
-    idx = [c.strip() for c in cols]
-    res = []
-    for row in after_first_sep:
-        d: Dict[str, str] = {}
-        for i, val in enumerate(row):
-            d[idx[i]] = val.strip()
-        res.append(d)
-    return res
+            if first_sep is None:
+                first_sep = i
+        else:
+            rows.append(i)
+    if first_sep is not None:
+        header = [i for i in rows if i < first_sep]
+        if len(header) > 0:
+            return (header, [i for i in rows if i > first_sep])
+    return ([], rows)
+
+# with several header lines, the last one has the names (the others are still available as OrgTable.header)
+# without a header, columns are named like org-mode column references: $1, $2, ...
+def _column_names(lines: List[str], header: List[int], data: List[int]) -> List[str]:
+    if len(header) > 0:
+        return _split_row(lines[header[-1]])
+    if len(data) > 0:
+        return [f'${i + 1}' for i in range(len(_split_row(lines[data[0]])))]
+    return []
+
+# returns column names and cells, one list per column
+def _parse_org_table(lines: List[str]) -> Tuple[List[str], List[List[str]]]:
+    (header, data) = _table_layout(lines)
+    names = _column_names(lines, header, data)
+    columns: List[List[str]] = [[] for _ in names]
+    for i in data:
+        row = _split_row(lines[i])
+        for j, col in enumerate(columns):
+            col.append(row[j] if j < len(row) else '')
+    return (names, columns)
 
 # TODO err.. needs a better name
 class Base:
+    __slots__ = ('parent',)
+
     def __init__(self, parent):
         self.parent = parent
 
+class _TableRows(Sequence):
+    # rows of OrgTable as dicts, each one is parsed on access
+    __slots__ = ('_t',)
+
+    def __init__(self, t: 'OrgTable') -> None:
+        self._t = t
+
+    def __len__(self) -> int:
+        return len(self._t._layout[1])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return dict(zip(self._t._names, self._t._row(i)))
+
+    def __iter__(self):
+        t = self._t
+        names = t._names
+        for i in t._layout[1]:
+            yield dict(zip(names, t._pad(_split_row(t._rows[i]))))
+
+    def __eq__(self, other):
+        return list(self) == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+# nothing is parsed upfront: the layout (which lines are header/data) is a single pass over the lines,
+# rows are split when accessed and cells are only stored by column once the column api is used
 class OrgTable(Base):
+    __slots__ = ('_rows', '_layout_', '_names_', '_cols', '_converted')
+
     def __init__(self, lines: List[str],  parent):
         super().__init__(parent=parent)
-        self.table = _parse_org_table(lines)
+        self._rows = lines
+        self._layout_: Optional[Tuple[List[int], List[int]]] = None
+        self._names_: Optional[List[str]] = None
+        self._cols: Optional[List[List[str]]] = None
+        self._converted: Dict[Tuple[str, Any], Any] = {}
+
+    @property
+    def _profile(self) -> Optional[Profile]:
+        return self.parent.profile
+
+    @property
+    def _layout(self) -> Tuple[List[int], List[int]]:
+        if self._layout_ is None:
+            with _phase(self._profile, 'table_parse'):
+                self._layout_ = _table_layout(self._rows)
+        return self._layout_
+
+    @property
+    def _names(self) -> List[str]:
+        if self._names_ is None:
+            (header, data) = self._layout
+            self._names_ = _column_names(self._rows, header, data)
+        return self._names_
+
+    @property
+    def _columns(self) -> List[List[str]]:
+        if self._cols is None:
+            with _phase(self._profile, 'table_parse'):
+                (self._names_, self._cols) = _parse_org_table(self._rows)
+        return self._cols
+
+    def _pad(self, row: List[str]) -> List[str]:
+        n = len(self._names)
+        return row[:n] if len(row) >= n else row + [''] * (n - len(row))
+
+    def _row(self, i: int) -> List[str]:
+        return self._pad(_split_row(self._rows[self._layout[1][i]]))
+
+    def _column_idx(self, col: str) -> int:
+        names = self._names
+        # if names are repeated, the last one wins, same as with dicts
+        for i in range(len(names) - 1, -1, -1):
+            if names[i] == col:
+                return i
+        raise KeyError(col)
+
+    @property
+    def table(self) -> Sequence:
+        return _TableRows(self)
 
     @property
     def columns(self) -> List[str]:
-        return list(self.table[0].keys())
+        return list(dict.fromkeys(self._names))
+
+    # all lines before the first separator, empty if the table has no header
+    @property
+    def header(self) -> List[List[str]]:
+        return [_split_row(self._rows[i]) for i in self._layout[0]]
 
     @property
     def lines(self):
-        for l in self.table:
-            yield l
+        yield from self.table
 
     def __getitem__(self, idx):
         (line, col) = idx # TODO not sure if it's a good idea..
-        return self.table[line][col]
+        j = self._column_idx(col)
+        if self._cols is not None:
+            return self._cols[j][line]
+        return self._row(line)[j]
+
+    # conv: int, float, 'date' (parsed with parse_org_date) or any callable; empty cells become None
+    def column(self, name: str, conv: Optional[Union[type, str, Callable[[str], Any]]]=None) -> List[Any]:
+        raw = self._columns[self._column_idx(name)]
+        if conv is None:
+            return raw
+        key = (name, conv)
+        res = self._converted.get(key)
+        if res is None:
+            f = parse_org_date if conv == 'date' else conv
+            assert callable(f), conv
+            res = [None if len(c) == 0 else f(c) for c in raw]
+            self._converted[key] = res
+        return res
+
+    # numeric column as array.array, empty cells are replaced with fill
+    # by default that's nan for floating point typecodes, integer ones have no default and raise on empty cells
+    def column_array(self, name: str, typecode: str='d', fill: Optional[Union[int, float]]=None):
+        import array
+        key = (name, 'array:' + typecode, fill)
+        res = self._converted.get(key)
+        if res is None:
+            floating = typecode in 'fd'
+            vals = self.column(name, float if floating else int)
+            if fill is None and floating:
+                fill = float('nan')
+            if fill is None:
+                if None in vals:
+                    raise RuntimeError(f"Column {name!r} has empty cells, pass fill to use typecode {typecode!r}")
+            else:
+                vals = [fill if v is None else v for v in vals]
+            res = array.array(typecode, vals)
+            self._converted[key] = res
+        return res
+
+    # numeric dtypes share memory with column_array (unless there is no array typecode for them, e.g. float16),
+    # datetime64 ones are built from the 'date' column and unicode ones from the cells as they are
+    def to_numpy(self, name: str, dtype='float64', fill: Optional[Union[int, float]]=None):
+        import array
+        import numpy as np # type: ignore
+        dt = np.dtype(dtype)
+        if dt.kind == 'M':
+            return np.array([np.datetime64('NaT') if d is None else d for d in self.column(name, 'date')], dtype=dt)
+        if dt.kind == 'U':
+            return np.array(self.column(name), dtype=dt)
+        if dt.kind not in 'iuf':
+            raise RuntimeError(f"Unsupported dtype {dt}, expected an integer, float, datetime64 or unicode one")
+        if dt.char not in array.typecodes:
+            return np.array(self.column_array(name, 'd' if dt.kind == 'f' else 'q', fill=fill)).astype(dt)
+        return np.frombuffer(self.column_array(name, dt.char, fill=fill), dtype=dt)
 
     def __repr__(self):
         return "OrgTable{" + repr(self.table) + "}"
 
+
+# kind is one of 'text', 'table', 'src', 'block' (other #+BEGIN_ blocks), 'drawer', 'list'
+class Block(NamedTuple):
+    kind: str
+    lines: List[str]
+    table: Optional[OrgTable] = None
+
+
+_TABLE_ROW   = re.compile(r'\s*(?P<cells>\|(.+\|)+)s*$')
+_BLOCK_BEGIN = re.compile(r'\s*#\+begin_(?P<name>\S+)', re.IGNORECASE)
+_DRAWER      = re.compile(r'\s*:(?P<name>[\w-]+):\s*$')
+_DRAWER_END  = re.compile(r'\s*:end:\s*$', re.IGNORECASE)
+_LIST_ITEM   = re.compile(r'(?P<indent>\s*)([-+]|\s\*|\d+[.)])\s')
+
+
+def _tokenize_body(lines: List[str], parent) -> List[Block]:
+    res: List[Block] = []
+
+    def add(kind: str, ls: List[str]) -> None:
+        if kind == 'text' and len(res) > 0 and res[-1].kind == 'text':
+            res[-1].lines.extend(ls)
+        else:
+            res.append(Block(kind, ls))
+
+    i = 0
+    n = len(lines)
+    while i < n:
+        line = lines[i]
+        m = _TABLE_ROW.match(line)
+        if m is not None:
+            rows = []
+            while m is not None:
+                rows.append(m.group('cells'))
+                i += 1
+                m = _TABLE_ROW.match(lines[i]) if i < n else None
+            res.append(Block('table', lines[i - len(rows): i], OrgTable(rows, parent=parent)))
+            continue
+
+        m = _BLOCK_BEGIN.match(line)
+        if m is not None:
+            end = re.compile(r'\s*#\+end_' + re.escape(m.group('name')) + r'\b', re.IGNORECASE)
+            j = next((j for j in range(i + 1, n) if end.match(lines[j])), None)
+            if j is not None:
+                add('src' if m.group('name').lower() == 'src' else 'block', lines[i: j + 1])
+                i = j + 1
+                continue
+
+        m = _DRAWER.match(line)
+        if m is not None and m.group('name').lower() != 'end':
+            j = next((j for j in range(i + 1, n) if _DRAWER_END.match(lines[j])), None)
+            if j is not None:
+                add('drawer', lines[i: j + 1])
+                i = j + 1
+                continue
+
+        m = _LIST_ITEM.match(line)
+        if m is not None:
+            # items and whatever is indented deeper than the bullet
+            indent = len(m.group('indent'))
+            j = i + 1
+            while j < n:
+                ll = lines[j]
+                if _TABLE_ROW.match(ll):
+                    break
+                stripped = len(ll) - len(ll.lstrip())
+                mi = _LIST_ITEM.match(ll)
+                if (mi is not None and len(mi.group('indent')) >= indent) or (len(ll.strip()) > 0 and stripped > indent):
+                    j += 1
+                else:
+                    break
+            add('list', lines[i: j])
+            i = j
+            continue
+
+        add('text', [line])
+        i += 1
+    return res
+
+
+# state shared by the whole tree, only the root node has it
+class _Tree:
+    __slots__ = ('source', 'version', 'xml_cache', 'query_cache', 'search_index', 'filetags', 'spans_valid', 'mmap', 'buffer', 'buffer_stat', 'profile', 'lock')
+
+    def __init__(self) -> None:
+        self.source: Optional[Path] = None
+        self.version = 0 # bumped on every update
+        self.xml_cache: Optional['_XmlCache'] = None
+        self.query_cache: Optional['_QueryCache'] = None
+        self.search_index: Optional['SearchIndex'] = None
+        self.filetags: Optional[Set[str]] = None
+        self.spans_valid = False
+        self.mmap = False
+        self.buffer: Optional[Any] = None # mmap of the source, if it's safe to slice it
+        self.buffer_stat: Optional[Tuple[int, int]] = None # (size, mtime_ns) of the source when it was mapped
+        self.profile: Optional[Profile] = None
+        self.lock: Optional[threading.Lock] = None # serializes the async API calls, created on first use
+
+    # trees are sent between processes (e.g. by OrgCorpus), locks can't be
+    def __getstate__(self):
+        return {k: None if k == 'lock' else getattr(self, k) for k in self.__slots__}
+
+    def __setstate__(self, state) -> None:
+        for k, v in state.items():
+            setattr(self, k, v)
+
+
+_TREE_LOCK = threading.Lock()
+
+
+def _tree_lock(tree: _Tree) -> threading.Lock:
+    with _TREE_LOCK:
+        if tree.lock is None:
+            tree.lock = threading.Lock()
+        return tree.lock
+
+
+# the result of these has to refer to nodes of the tree in this process, so they can only run in threads
+def _check_thread_executor(executor: Optional[Executor], what: str) -> None:
+    if isinstance(executor, ProcessPoolExecutor):
+        raise RuntimeError(f"{what} can't run in a process pool, use a thread pool or None for the default one")
+
+
+# 0-based, end exclusive; byte offsets assume utf8 and '\n' line endings
+class Span(NamedTuple):
+    start_line: int
+    end_line: int
+    start: int
+    end: int
+
+
+# splitlines treats these as line breaks too, so if a file has them, lines don't map onto '\n' separated buffer lines
+_EXTRA_LINE_BREAKS = [b'\r', b'\x0b', b'\x0c', b'\x1c', b'\x1d', b'\x1e', '\x85'.encode('utf8'), '\u2028'.encode('utf8'), '\u2029'.encode('utf8')]
+
+
+# returns the mapping and (size, mtime_ns) of the file it was made from
+def _mmap_file(path: Path) -> Tuple[Any, Tuple[int, int]]:
+    import mmap
+    with path.open('rb') as fo:
+        st = os.fstat(fo.fileno())
+        key = (st.st_size, st.st_mtime_ns)
+        try:
+            return (mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ), key)
+        except ValueError: # empty files can't be mapped
+            return (b'', key)
+
+
+def _stat_key(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class Changes(NamedTuple):
+    added: List['Org']
+    removed: List['Org']
+    modified: List[Tuple['Org', 'Org']] # (old, new)
+
+    def __bool__(self) -> bool:
+        return len(self.added) + len(self.removed) + len(self.modified) > 0
+
+
+_HEADING_STARS = re.compile(r'(\*+) ')
+
+
+def _iter_sections(lines: Iterable[str]) -> Iterator[List[str]]:
+    # first one is the text before the first heading, the rest start with a child of the root
+    # same as orgparse, headings are stars followed by a space, and a heading is a child of the root
+    # unless there is a heading with a lower level before it (so e.g. '** a' before the first '* b' is one too)
+    cur: List[str] = []
+    min_level: Optional[int] = None
+    for l in lines:
+        m = _HEADING_STARS.match(l)
+        if m is not None:
+            level = len(m.group(1))
+            if min_level is None or level <= min_level:
+                min_level = level
+                yield cur
+                cur = []
+        cur.append(l)
+    yield cur
+
+
+def _split_sections(lines: List[str]) -> List[List[str]]:
+    return list(_iter_sections(lines))
+
+
+def _iter_lines(fo, chunk_size: int) -> Iterator[str]:
+    # same as str.splitlines (which is what orgparse uses), but without reading everything in memory
+    rest = ''
+    while True:
+        chunk = fo.read(chunk_size)
+        if len(chunk) == 0:
+            break
+        lines = (rest + chunk).splitlines(keepends=True)
+        last = lines.pop()
+        if last.splitlines()[0] == last: # incomplete, wait for the next chunk
+            rest = last
+        else:
+            lines.append(last)
+            rest = ''
+        for l in lines:
+            yield l.splitlines()[0]
+    if len(rest) > 0:
+        yield rest
+
+
 class Org(Base):
+    # wrappers are created once per node (see children) and kept alive by the parent, so keep them small
+    __slots__ = (
+        'node',
+        '_root',
+        '_children',
+        '_tree',
+        '_span',
+        '_blocks',
+        '_tag_index',
+        '_date_index',
+        '_search_index',
+    )
+
     def __init__(self, root, parent):
         super().__init__(parent=parent)
         self.node = root
+        self._root: 'Org' = self if parent is None else parent._root
+        self._children: Optional[List['Org']] = None
+        self._tree: Optional[_Tree] = _Tree() if parent is None else None
+        self._span: Optional[Tuple[int, int, int, int, int, int, int]] = None
+        self._blocks: Optional[List[Block]] = None
+        self._tag_index: Optional['TagIndex'] = None
+        self._date_index: Optional['DateIndex'] = None
+        self._search_index: Optional['SearchIndex'] = None
+
+    # cache_dir: keep parsed trees there and reuse them if the file didn't change, see porg.cache
+    # mmap: keep the file memory mapped, so get_raw/body/raw_bytes slice it instead of joining lines
+    # profile: same as calling enable_profiling, but parsing the file is recorded as well
+    @classmethod
+    def from_file(cls, fname: Union[Path, str], xml_cache=False, cache_dir: Optional[Union[Path, str]]=None, mmap=False, profile=False):
+        path = Path(fname)
+        (buf, buf_stat) = _mmap_file(path) if mmap else (None, None)
+        if cache_dir is not None:
+            from .cache import get_cache
+            start = perf_counter()
+            base = get_cache(cache_dir).load(path)
+            res = Org._from_base(base, xml_cache=xml_cache, profile=profile, parse_time=perf_counter() - start)
+        elif buf is not None:
+            res = cls.from_string(str(buf, 'utf8'), xml_cache=xml_cache, profile=profile)
+        else:
+            res = cls.from_string(path.read_text(), xml_cache=xml_cache, profile=profile)
+        res._tree.source = path
+        if buf is not None:
+            res._attach_buffer(buf, buf_stat)
+        return res
 
+    # from_file in the executor, for use from an event loop; None means the loop's default thread pool
+    # with a ProcessPoolExecutor the tree is sent back pickled, so mmap isn't supported there
     @classmethod
-    def from_file(cls, fname: Union[Path, str]):
-        return cls.from_string(Path(fname).read_text())
+    async def afrom_file(cls, fname: Union[Path, str], executor: Optional[Executor]=None, **kwargs) -> 'Org':
+        if kwargs.get('mmap') and isinstance(executor, ProcessPoolExecutor):
+            raise RuntimeError("mmap trees can't be sent between processes")
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, partial(cls.from_file, fname, **kwargs))
+
+    def _attach_buffer(self, buf, buf_stat: Tuple[int, int]) -> None:
+        tree = self._tree
+        tree.mmap = True
+        tree.buffer_stat = buf_stat
+        if any(buf.find(b) != -1 for b in _EXTRA_LINE_BREAKS):
+            return
+        (_, end) = self._index_spans(0, 0)
+        tree.spans_valid = True
+        if end not in (len(buf), len(buf) + 1): # +1 if there is no trailing newline
+            get_logger().warning("%s: file doesn't match the parsed tree, not using mmap", tree.source)
+            return
+        tree.buffer = buf
 
     @staticmethod
-    def from_string(s: str):
+    def from_string(s: str, xml_cache=False, profile=False):
+        start = perf_counter()
         base = orgparse.loads(s)
-        return Org(base, parent=None)
+        return Org._from_base(base, xml_cache=xml_cache, profile=profile, parse_time=perf_counter() - start)
+
+    @staticmethod
+    def _from_base(base, xml_cache: bool, profile: bool=False, parse_time: float=0.0) -> 'Org':
+        res = Org(base, parent=None)
+        if xml_cache:
+            res.enable_xml_cache()
+        if profile:
+            res.enable_profiling().record('parse', parse_time)
+        return res
+
+    # rereads the file the tree was loaded from, see update_from_string
+    def reload(self) -> Changes:
+        root = self._root
+        tree = root._tree
+        src = tree.source
+        if src is None:
+            raise RuntimeError("Tree wasn't loaded from a file, use update_from_string instead")
+        if not tree.mmap:
+            return root.update_from_string(src.read_text())
+        (buf, buf_stat) = _mmap_file(src)
+        changes = root.update_from_string(str(buf, 'utf8'))
+        root._attach_buffer(buf, buf_stat)
+        return changes
+
+    # diffs the new text against the current tree on top level heading granularity and only reparses changed sections
+    # wrappers for unchanged sections (along with anything cached on them) are kept
+    # if file settings (#+TODO, #+FILETAGS etc) change, everything is reparsed
+    @_profiled('parse')
+    def update_from_string(self, s: str) -> Changes:
+        assert self.is_root(), 'Updates only make sense for the root node'
+        tree = self._tree
+        assert tree is not None
+
+        sections = _split_sections(s.splitlines())
+        old_children = self.children
+        preamble_changed = sections[0] != self.node._lines
+        preamble = orgparse.loadi(sections[0]) if preamble_changed else self.node
+
+        if preamble._special_comments != self.node._special_comments:
+            self.node = orgparse.loads(s)
+            self._blocks = None
+            self._children = None
+            changes = Changes(added=list(self.children), removed=old_children, modified=[])
+        else:
+            import difflib
+            old = ['\n'.join(c._get_raw(heading=True, recursive=True)) for c in old_children]
+            new = ['\n'.join(ls) for ls in sections[1:]]
+            env = self.node.env
+            if preamble_changed:
+                self.node = preamble
+                self._blocks = None
+            children: List[Org] = []
+            changes = Changes(added=[], removed=[], modified=[])
+            for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+                if op == 'equal':
+                    children.extend(old_children[i1: i2])
+                    continue
+                olds = old_children[i1: i2]
+                news = [self._parse_section(ls, env) for ls in sections[1 + j1: 1 + j2]]
+                children.extend(news)
+                paired = min(len(olds), len(news))
+                changes.modified.extend(zip(olds[:paired], news[:paired]))
+                changes.removed.extend(olds[paired:])
+                changes.added.extend(news[paired:])
+            self._children = children
+
+        if changes or preamble_changed:
+            tree.version += 1
+            tree.filetags = None
+            tree.spans_valid = False
+            tree.buffer = None
+            if tree.xml_cache is not None:
+                tree.xml_cache.invalidate()
+            if tree.query_cache is not None:
+                tree.query_cache.invalidate()
+            if tree.search_index is not None:
+                tree.search_index.update(changes)
+            # indices on the root cover the whole tree, so have to be rebuilt
+            self._tag_index = None
+            self._date_index = None
+        return changes
+
+    def _parse_section(self, lines: List[str], env) -> 'Org':
+        # parsed separately, but with the same TODO keywords as the rest of the file
+        senv = orgparse.node.OrgEnv(todos=env.todo_keys, dones=env.done_keys, filename=env.filename)
+        [node] = orgparse.loadi(lines, filename=env.filename, env=senv).children
+        return Org(node, parent=self)
+
+    # single pass over a (potentially huge) file: yields top level entries one by one, as soon as each is read
+    # the entries have a common root with the file settings (so e.g. FILETAGS are applied), but it doesn't keep them as children
+    # so memory only depends on the size of the largest entry
+    @staticmethod
+    def iter_file(fname: Union[Path, str], chunk_size: int=1 << 20) -> Iterator['Org']:
+        path = Path(fname)
+        root: Optional[Org] = None
+        line, byte = 0, 0
+        with path.open() as fo:
+            for section in _iter_sections(_iter_lines(fo, chunk_size=chunk_size)):
+                if root is None: # first one is the preamble
+                    root = Org(orgparse.loadi(section), parent=None)
+                    root._tree.source = path
+                    root._children = []
+                    line, byte = root._index_spans(line, byte)
+                    root._tree.spans_valid = True
+                else:
+                    entry = root._parse_section(section, root.node.env)
+                    line, byte = entry._index_spans(line, byte)
+                    yield entry
+
+    # opt-in: xpath_all on any node of the tree reuses a single XML materialization instead of running Hiccup each time
+    # the cache doesn't track modifications, so call invalidate_xml_cache if you change the underlying nodes
+    def enable_xml_cache(self) -> None:
+        root = self._root
+        if root._tree.xml_cache is None:
+            root._tree.xml_cache = _XmlCache()
+
+    def disable_xml_cache(self) -> None:
+        self._root._tree.xml_cache = None
+
+    def invalidate_xml_cache(self) -> None:
+        cache = self._root._tree.xml_cache
+        if cache is not None:
+            cache.invalidate()
+
+    @property
+    def xml_cache_stats(self) -> Optional['CacheStats']:
+        cache = self._root._tree.xml_cache
+        return None if cache is None else cache.stats
+
+    # opt-in: keeps results of the last size xpath_all/with_tag/with_tags/query calls on any node of the tree
+    # entries are keyed by the tree version, so update_from_string/reload make them stale automatically
+    # like with the XML cache, call invalidate_query_cache if you change the underlying nodes
+    def enable_query_cache(self, size: int=128) -> None:
+        tree = self._root._tree
+        if tree.query_cache is None:
+            tree.query_cache = _QueryCache(size)
+        else:
+            tree.query_cache.resize(size)
+
+    def disable_query_cache(self) -> None:
+        self._root._tree.query_cache = None
+
+    def invalidate_query_cache(self) -> None:
+        cache = self._root._tree.query_cache
+        if cache is not None:
+            cache.invalidate()
 
     @property
-    def _root(self) -> 'Org': # TODO cache?
-        x = self
-        while not x.is_root():
-            x = x.parent
-        return x
+    def query_cache_stats(self) -> Optional['CacheStats']:
+        cache = self._root._tree.query_cache
+        return None if cache is None else cache.stats
+
+    def _cached(self, key: Tuple, compute: Callable[[], List[Any]]) -> List[Any]:
+        tree = self._root._tree
+        cache = tree.query_cache
+        if cache is None:
+            return compute()
+        # wrappers are memoized, so the node itself identifies where the query started
+        return list(cache.get((tree.version, self) + key, compute)) # copy, so callers can't mess up the cached list
+
+    # opt-in: records call counts and cumulative time of parsing, serialization, queries etc. for the whole tree, see porg.profiling
+    def enable_profiling(self) -> Profile:
+        tree = self._root._tree
+        if tree.profile is None:
+            tree.profile = Profile()
+        return tree.profile
+
+    # returns the collected profile (if there was one) and logs it
+    def disable_profiling(self) -> Optional[Profile]:
+        tree = self._root._tree
+        prof = tree.profile
+        tree.profile = None
+        if prof is not None:
+            prof.log()
+        return prof
+
+    @property
+    def profile(self) -> Optional[Profile]:
+        return self._root._tree.profile
 
     @property
     def file_settings(self) -> Dict[str, List[str]]:
@@ -139,11 +783,14 @@ class Org(Base):
 
     @property
     def _filetags(self) -> Set[str]: # TODO maybe, deserves to be non private?
-        ftags = self.file_settings.get('FILETAGS', [])
-        res: Set[str] = set()
-        for ft in ftags:
-            res.update(t for t in ft.split(':') if len(t.strip()) != 0)
-        return res
+        root = self._root
+        if root._tree.filetags is None:
+            ftags = self.file_settings.get('FILETAGS', [])
+            res: Set[str] = set()
+            for ft in ftags:
+                res.update(t for t in ft.split(':') if len(t.strip()) != 0)
+            root._tree.filetags = res
+        return set(root._tree.filetags)
 
     # TODO not sure if empty tags should be filtered?
     @property
@@ -200,7 +847,11 @@ class Org(Base):
     def _created_impl(self) -> Optional[Dateish]:
         cs = self._created_str
         if cs is not None:
-            return parse_org_date(cs)
+            prof = self._root._tree.profile
+            if prof is None: # hot path, so not using _phase
+                return parse_org_date(cs)
+            with prof.phase('date_parse'):
+                return parse_org_date(cs)
         return None
 
     def _throw(self, e: Exception) -> NoReturn:
@@ -216,32 +867,29 @@ class Org(Base):
     # TODO should be private?
     @property
     def contents(self) -> List[Union[str, OrgTable]]:
-        TABLE_ROW = r'\s*(?P<cells>\|(.+\|)+)s*$'
-        if self.is_root():
-            lines = self.node._lines
-        else:
-            lines = self.node._body_lines
-
-        items = []
-        for line in lines:
-            m = re.match(TABLE_ROW, line)
-            if m is not None:
-                items.append(m)
-            else:
-                items.append(line)
-
         res: List[Union[str, OrgTable]] = []
-        for t, g in groupby(items, key=lambda c: type(c)):
-            if t == type(''): # meh:
-                res.extend(g) # type: ignore
-            else: # should be table cells?
-                rows = [m.group('cells') for m in g]
-                res.append(OrgTable(rows, parent=self))
+        for b in self.blocks:
+            if b.table is not None:
+                res.append(b.table)
+            else:
+                res.extend(b.lines)
         return res
 
+    # body split into typed blocks, computed once per node
+    @property
+    def blocks(self) -> List[Block]:
+        if self._blocks is None:
+            lines = self.node._lines if self.is_root() else self.node._body_lines
+            self._blocks = _tokenize_body(lines, parent=self)
+        return self._blocks
+
+    @property
+    def tables(self) -> List[OrgTable]:
+        return [b.table for b in self.blocks if b.table is not None]
+
     @property
     def body(self) -> str:
-        return '\n'.join(self.node._lines) if self.is_root() else self.node.get_body(format='raw')
+        return self.get_raw()
 
 
     # TODO not a great function... semantics is pretty confusing
@@ -265,14 +913,99 @@ class Org(Base):
         else:
             lines.extend(self.node._lines if heading else self.node._body_lines)
         if recursive:
-            for c in self.children:
+            for c in self._get_children():
                 lines.extend(c._get_raw(heading=True, recursive=True))
         return lines
 
     # TODO hmm orparse extracts some of the timestamps...
     def get_raw(self, heading=False, recursive=False) -> str:
+        sl = self._raw_slice(heading=heading, recursive=recursive)
+        if sl is not None:
+            (start, end) = sl
+            return str(memoryview(self._root._tree.buffer)[start: end], 'utf8')
         return '\n'.join(self._get_raw(heading=heading, recursive=recursive))
 
+    # zero copy in mmap mode
+    def raw_bytes(self, heading=False, recursive=False) -> memoryview:
+        sl = self._raw_slice(heading=heading, recursive=recursive)
+        if sl is not None:
+            (start, end) = sl
+            return memoryview(self._root._tree.buffer)[start: end]
+        return memoryview(self.get_raw(heading=heading, recursive=recursive).encode('utf8'))
+
+    def _raw_slice(self, heading: bool, recursive: bool) -> Optional[Tuple[int, int]]:
+        tree = self._root._tree
+        buf = tree.buffer
+        if buf is None:
+            return None
+        # the mapping is shared with the file: if it shrank, reading past the end kills the process (SIGBUS)
+        # and if it was edited in place, the bytes don't match the tree anymore. In both cases lines are joined instead
+        if _stat_key(tree.source) != tree.buffer_stat:
+            get_logger().warning("%s: file changed since it was loaded, not using mmap", tree.source)
+            tree.buffer = None
+            return None
+        if self.is_root():
+            assert not heading, "Including heading doesn't make sense for root node"
+        (_, byte, body_byte, _, end_byte, _, sub_end_byte) = self._get_span()
+        if heading or self.is_root():
+            start = byte
+        elif len(self.node._body_lines) == len(self.node._lines) - 1:
+            start = body_byte
+        else: # orgparse strips drawers and such from the body, so it's not contiguous
+            return None
+        end = min(sub_end_byte if recursive else end_byte, len(buf))
+        if end > start and buf[end - 1] == ord('\n'):
+            end -= 1
+        return (start, end)
+
+    # spans are computed for the whole tree in one go, by adding up lengths of the lines
+    def _index_spans(self, line: int, byte: int) -> Tuple[int, int]:
+        lines = self.node._lines
+        body_byte = byte
+        end_byte = byte
+        for i, l in enumerate(lines):
+            end_byte += len(l.encode('utf8')) + 1
+            if i == 0 and not self.is_root():
+                body_byte = end_byte
+        end_line = line + len(lines)
+        sline, sbyte = end_line, end_byte
+        for c in self._get_children():
+            sline, sbyte = c._index_spans(sline, sbyte)
+        self._span = (line, byte, body_byte, end_line, end_byte, sline, sbyte)
+        return (sline, sbyte)
+
+    def _get_span(self) -> Tuple[int, int, int, int, int, int, int]:
+        root = self._root
+        tree = root._tree
+        if not tree.spans_valid:
+            root._index_spans(0, 0)
+            tree.spans_valid = True
+        assert self._span is not None
+        return self._span
+
+    # heading and body, without children
+    @property
+    def span(self) -> Span:
+        (line, byte, _, end_line, end_byte, _, _) = self._get_span()
+        return Span(line, end_line, byte, end_byte)
+
+    # everything after the heading line, including drawers that orgparse doesn't consider part of the body
+    @property
+    def body_span(self) -> Span:
+        (line, _, body_byte, end_line, end_byte, _, _) = self._get_span()
+        return Span(line if self.is_root() else line + 1, end_line, body_byte, end_byte)
+
+    # heading, body and all descendants
+    @property
+    def subtree_span(self) -> Span:
+        (line, byte, _, _, _, sub_end_line, sub_end_byte) = self._get_span()
+        return Span(line, sub_end_line, byte, sub_end_byte)
+
+    # 1-based, for jumping to the source
+    @property
+    def linenumber(self) -> int:
+        return self.span.start_line + 1
+
     @property
     def properties(self) -> Dict[str, str]:
         if self.is_root():
@@ -281,9 +1014,16 @@ class Org(Base):
         else:
             return self.node.properties
 
+    # memoized, so the same node always gets the same wrapper
+    # internal, callers outside shouldn't be able to modify the tree through it
+    def _get_children(self) -> List['Org']:
+        if self._children is None:
+            self._children = [Org(c, parent=self) for c in self.node.children]
+        return self._children
+
     @property
     def children(self) -> List['Org']:
-        return [Org(c, parent=self) for c in self.node.children]
+        return list(self._get_children())
 
     @property
     def level(self):
@@ -295,67 +1035,606 @@ class Org(Base):
             yield self
         if depth == 0:
             return
-        for c in self.children:
+        for c in self._get_children():
             yield from c.iterate(None if depth is None else depth - 1)
 
+    # same scope as '//org' in xpath_all: descendants, not including the node itself
+    def _descendants(self) -> Iterator['Org']:
+        for c in self._get_children():
+            yield from c.iterate()
+
+    def iquery(self, pred: Callable[['Org'], bool]) -> Iterator['Org']:
+        for o in self._descendants():
+            if pred(o):
+                yield o
+
+    # pred is anything callable on Org, normally composed from porg.query predicates
+    # with the query cache, Pred instances are cached by their description, any other callables by identity
+    @_profiled('query')
+    def query(self, pred: Callable[['Org'], bool]) -> List['Org']:
+        key = ('query', pred.desc if isinstance(pred, Pred) else pred)
+        return self._cached(key, lambda: list(self.iquery(pred)))
+
+    # flat dicts with the requested fields for every node iterate() would yield, see porg.export
+    def iter_records(self, fields: Iterable[str]=('heading', 'level', 'tags', 'properties', 'created')) -> Iterator[Dict[str, Any]]:
+        from .export import iter_records
+        return iter_records(self, fields)
+
+    def to_records(self, fields: Iterable[str]=('heading', 'level', 'tags', 'properties', 'created')) -> List[Dict[str, Any]]:
+        from .export import to_records
+        return to_records(self, fields)
+
+    # field -> list of values, one per node
+    def to_columns(self, fields: Iterable[str]=('heading', 'level', 'tags', 'properties', 'created')) -> Dict[str, List[Any]]:
+        from .export import to_columns
+        return to_columns(self, fields)
+
+    # created/scheduled/deadline/clock timestamps as numpy arrays, see porg.timeline (requires numpy)
+    def timeline(self, kinds: Iterable[str]=('created', 'scheduled', 'deadline', 'clock')) -> 'Timeline':
+        from .timeline import timeline
+        return timeline(self, kinds)
+
     def __repr__(self):
         return 'Org{{{}}}'.format(self.heading)
     # TODO parent caches its tags??
 
-    # TODO line numbers
-
-    def with_tag(self, tag: str, with_inherited=True) -> List['Org']:
-        if with_inherited:
-            tt = 'tags'
-        else:
-            tt = 'self_tags'
+    # node that keeps the indices covering this one: the root, or for nodes detached from the root's children
+    # (iter_file entries, nodes removed by update_from_string) their top level ancestor
+    def _index_owner(self) -> 'Org':
+        root = self._root
+        if self is root:
+            return root
+        if root._tag_index is None:
+            root._tag_index = TagIndex(root)
+        if self in root._tag_index:
+            return root
+        top = self
+        while top.parent is not root:
+            top = top.parent
+        return top
+
+    # covers the same nodes as query()
+    # only the owner keeps an index (built on first use), for other nodes it's a view of the subtree range of it
+    @property
+    def tag_index(self) -> 'TagIndex':
+        owner = self._index_owner()
+        if owner._tag_index is None:
+            owner._tag_index = TagIndex(owner)
+        index = owner._tag_index
+        if self is owner:
+            return index
+        return index._subtree(self)
 
-        return self.xpath_all(f"//org[./{tt}/*[text()='{tag}']]")
+    @property
+    def date_index(self) -> 'DateIndex':
+        if self._date_index is None:
+            self._date_index = DateIndex(self)
+        return self._date_index
+
+    # full text index over headings and bodies of the whole tree, built on first use
+    # unlike the other indices it's updated incrementally by update_from_string/reload rather than rebuilt
+    # detached nodes get a separate one, kept on their top level ancestor (see _index_owner) and never updated
+    @property
+    def search_index(self) -> 'SearchIndex':
+        from .search import SearchIndex
+        owner = self._index_owner()
+        if not owner.is_root():
+            if owner._search_index is None:
+                owner._search_index = SearchIndex.from_org(owner)
+            return owner._search_index
+        tree = owner._tree
+        if tree.search_index is None:
+            tree.search_index = SearchIndex.from_org(owner)
+        return tree.search_index
+
+    # BM25 ranked, best first; see SearchIndex.search for the query syntax
+    # from other nodes, only results within the node's subtree (including the node itself) are returned
+    @_profiled('query')
+    def search(self, query: str, limit: Optional[int]=10, prefix=False) -> List['SearchResult']:
+        owner = self._index_owner()
+        index = owner.search_index
+        if self is owner:
+            return index.search(query, limit=limit, prefix=prefix)
+        # subtrees are contiguous ranges of the tag index
+        tindex = owner.tag_index
+        lo = tindex._pos[self]
+        hi = tindex._ends[lo]
+        res = []
+        for r in index.search(query, limit=None, prefix=prefix):
+            i = tindex._pos.get(r.org)
+            if i is not None and lo <= i < hi:
+                res.append(r)
+                if limit is not None and len(res) == limit:
+                    break
+        return res
 
-    def xpath(self, q: str):
-        r = self.xpath_all(q)
+    @_profiled('query')
+    def with_tag(self, tag: str, with_inherited=True) -> List['Org']:
+        return self._cached(
+            ('with_tag', tag, with_inherited),
+            lambda: self.tag_index.with_tag(tag, with_inherited=with_inherited),
+        )
+
+    @_profiled('query')
+    def with_tags(self, all_of=(), any_of=(), none_of=(), with_inherited=True) -> List['Org']:
+        return self._cached(
+            ('with_tags', frozenset(all_of), frozenset(any_of), frozenset(none_of), with_inherited),
+            lambda: self.tag_index.with_tags(all_of=all_of, any_of=any_of, none_of=none_of, with_inherited=with_inherited),
+        )
+
+    def xpath(self, q: Union[str, 'CompiledQuery']):
         [res] = self.xpath_all(q)
         return res
 
     def firstlevel(self) -> List['Org']:
-        return self.xpath_all('/root/children/org')
-
-    def xpath_all(self, q: str) -> List['Org']:
-        import types
-
-        h = Hiccup()
-        for cls in (datetime, date, OrgTable):
-            h.exclude(IfPType(cls))
-
-        # TODO ignore by default?..
-        h.exclude(IfType(types.GeneratorType))
-        h.exclude(IfPType(Base), IfName('parent'))
-
-        for att in [
-                'parent',
-                '_content_split',
-                '_root',
-                'content',
-                'content_recursive',
-        ]:
+        return self.children
+
+    # q is either a string or a query from compile_query
+    def xpath_all(self, q: Union[str, 'CompiledQuery']) -> List['Org']:
+        cq = q if isinstance(q, CompiledQuery) else _compile_query_cached(q)
+        return self._cached(('xpath_all', cq.query), lambda: self._xpath_all(cq))
+
+    def _xpath_all(self, q: 'CompiledQuery') -> List['Org']:
+        cache = self._root._tree.xml_cache
+        if cache is not None:
+            return cache.xfind_all(self, q)
+
+        # Hiccup serializes and evaluates in one go, so the whole call counts as serialization
+        with _phase(self.profile, 'serialize'):
+            return q._hiccup.xfind_all(self, q.query)
+
+    # async API: the work runs in executor (None means the loop's default thread pool), so the event loop isn't blocked
+    # calls on the same tree are serialized (lazily built children, indices and caches aren't thread safe),
+    # calls on different trees run concurrently
+    def _locked(self, f: Callable[[], Any]) -> Callable[[], Any]:
+        lock = _tree_lock(self._root._tree)
+
+        def run():
+            with lock:
+                return f()
+        return run
+
+    async def axpath_all(self, q: Union[str, 'CompiledQuery'], executor: Optional[Executor]=None) -> List['Org']:
+        _check_thread_executor(executor, 'axpath_all')
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, self._locked(lambda: self.xpath_all(q)))
+
+    # same nodes as iterate, pulled in batches of batch_size
+    async def aiterate(self, depth=None, executor: Optional[Executor]=None, batch_size: int=1000) -> AsyncIterator['Org']:
+        _check_thread_executor(executor, 'aiterate')
+        loop = asyncio.get_event_loop()
+        it = self.iterate(depth)
+        take = self._locked(lambda: list(islice(it, batch_size)))
+        while True:
+            batch = await loop.run_in_executor(executor, take)
+            if len(batch) == 0:
+                break
+            for o in batch:
+                yield o
+
+
+def _make_hiccup(fields: Set[str]) -> Hiccup:
+    import types
+
+    h = Hiccup()
+    for cls in (datetime, date, OrgTable):
+        h.exclude(IfPType(cls))
+
+    # TODO ignore by default?..
+    h.exclude(IfType(types.GeneratorType))
+    h.exclude(IfPType(Base), IfName('parent'))
+
+    for att in [
+            'parent',
+            '_content_split',
+            '_root',
+            'content',
+            'content_recursive',
+    ]:
+        h.exclude(IfPType(Org), IfName(att))
+
+    # only serialize what the query can possibly look at, otherwise every query pays for dates, tables etc.
+    for att in dir(Org):
+        if not att.startswith('__') and att not in fields:
             h.exclude(IfPType(Org), IfName(att))
 
-        for cls in [
-                orgparse.node.OrgBaseNode,
-                orgparse.node.OrgNode,
-                orgparse.node.OrgRootNode,
-        ]:
-            h.exclude(IfType(cls))
+    for cls in [
+            orgparse.node.OrgBaseNode,
+            orgparse.node.OrgNode,
+            orgparse.node.OrgRootNode,
+    ]:
+        h.exclude(IfType(cls))
 
-        def set_root(x):
-            x.tag = 'root'
-        h.xml_hook = set_root
+    def set_root(x):
+        x.tag = 'root'
+    h.xml_hook = set_root
 
-        h.type_name_map.maps[Org] = 'org'
-        h.type_name_map.maps[OrgTable] = 'table'
-        # h.primitive_factory.converters[datetime] = lambda x: x.strftime('%Y%m%d%H:%M:%S')
+    h.type_name_map.maps[Org] = 'org'
+    h.type_name_map.maps[OrgTable] = 'table'
+    # h.primitive_factory.converters[datetime] = lambda x: x.strftime('%Y%m%d%H:%M:%S')
+    return h
 
-        return h.xfind_all(self, q)
+
+# xpath query with everything needed to run it prepared upfront: compiled xpath, fields to serialize and Hiccup config
+# not tied to any tree, so the same one can be used with many trees (e.g. all files in OrgCorpus)
+class CompiledQuery:
+    __slots__ = ('query', 'fields', '_xpath', '_hiccup')
+
+    def __init__(self, q: str) -> None:
+        try:
+            self._xpath = etree.XPath(q)
+        except etree.XPathSyntaxError as e:
+            raise RuntimeError(f'Bad xpath query {q!r}') from e
+        self.query = q
+        self.fields: FrozenSet[str] = frozenset(_xpath_fields(q))
+        self._hiccup = _make_hiccup(self.fields)
+
+    def __call__(self, org: 'Org') -> List[Any]:
+        return org.xpath_all(self)
+
+    def __repr__(self):
+        return 'CompiledQuery{{{}}}'.format(self.query)
+
+
+def compile_query(q: str) -> CompiledQuery:
+    return CompiledQuery(q)
+
+
+# so passing plain strings to xpath_all doesn't redo the setup either
+_compile_query_cached = lru_cache(256)(compile_query)
+
+
+# tag -> positions of nodes (in document order) carrying it, both for inherited and for own tags
+# inherited tags are computed top down during the same pass, rather than asking every node separately
+class TagIndex:
+    def __init__(self, org: 'Org') -> None:
+        self._all: List['Org'] = [] # descendants in document order, so every subtree is a contiguous range
+        self._ends: List[int] = [] # end of the subtree range for each node
+        self._pos: Dict['Org', int] = {}
+        self._tags: Dict[str, Set[int]] = {}
+        self._self_tags: Dict[str, Set[int]] = {}
+        self._walk(org, org.tags)
+        self._lo, self._hi = 0, len(self._all)
+
+    def _walk(self, org: 'Org', inherited: Set[str]) -> None:
+        for c in org._get_children():
+            idx = len(self._all)
+            self._all.append(c)
+            self._ends.append(idx + 1)
+            self._pos[c] = idx
+            own = c.self_tags
+            tags = inherited | own
+            for t in tags:
+                self._tags.setdefault(t, set()).add(idx)
+            for t in own:
+                self._self_tags.setdefault(t, set()).add(idx)
+            self._walk(c, tags)
+            self._ends[idx] = len(self._all)
+
+    def __contains__(self, o: 'Org') -> bool:
+        return o in self._pos
+
+    # same index restricted to the descendants of o (which has to be in it), the data is shared rather than copied
+    def _subtree(self, o: 'Org') -> 'TagIndex':
+        import copy
+        res = copy.copy(self)
+        i = self._pos[o]
+        res._lo, res._hi = i + 1, self._ends[i]
+        return res
+
+    @property
+    def nodes(self) -> List['Org']:
+        return self._all[self._lo: self._hi]
+
+    def _index(self, with_inherited: bool) -> Dict[str, Set[int]]:
+        return self._tags if with_inherited else self._self_tags
+
+    def _in_range(self, idxs) -> List[int]:
+        if self._lo == 0 and self._hi == len(self._all):
+            return list(idxs)
+        return [i for i in idxs if self._lo <= i < self._hi]
+
+    def _nodes(self, idxs) -> List['Org']:
+        return [self._all[i] for i in sorted(idxs)]
+
+    @property
+    def all_tags(self) -> Set[str]:
+        return {t for t, idxs in self._tags.items() if len(self._in_range(idxs)) > 0}
+
+    def counts(self, with_inherited=True) -> Dict[str, int]:
+        res = {t: len(self._in_range(idxs)) for t, idxs in self._index(with_inherited).items()}
+        return {t: c for t, c in res.items() if c > 0}
+
+    def with_tag(self, tag: str, with_inherited=True) -> List['Org']:
+        return self._nodes(self._in_range(self._index(with_inherited).get(tag, ())))
+
+    # nodes having all of all_of, at least one of any_of (if specified) and none of none_of
+    def with_tags(self, all_of=(), any_of=(), none_of=(), with_inherited=True) -> List['Org']:
+        index = self._index(with_inherited)
+        res: Set[int] = set(range(self._lo, self._hi))
+        for t in all_of:
+            res &= index.get(t, set())
+        if len(any_of) > 0:
+            anys: Set[int] = set()
+            for t in any_of:
+                anys |= index.get(t, set())
+            res &= anys
+        for t in none_of:
+            res -= index.get(t, set())
+        return self._nodes(res)
+
+    def __repr__(self):
+        return f'TagIndex{{nodes={self._hi - self._lo}, tags={len(self.all_tags)}}}'
+
+
+# nodes with created timestamp, sorted by it; each timestamp is only parsed once, when the index is built
+# dates and datetimes are compared as if dates were midnight datetimes
+class DateIndex:
+    def __init__(self, org: 'Org') -> None:
+        entries: List[Tuple[datetime, int, Dateish, 'Org']] = []
+        for i, o in enumerate(org._descendants()):
+            c = o.created
+            if c is not None:
+                entries.append((_as_datetime(c), i, c, o))
+        entries.sort(key=lambda e: (e[0], e[1])) # ties are kept in document order
+        self._keys: List[datetime] = [e[0] for e in entries]
+        self.created: List[Dateish] = [e[2] for e in entries]
+        self.nodes: List['Org'] = [e[3] for e in entries]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    # start <= created < end
+    def between(self, start: Dateish, end: Dateish) -> List['Org']:
+        lo = bisect_left(self._keys, _as_datetime(start))
+        hi = bisect_left(self._keys, _as_datetime(end))
+        return self.nodes[lo: hi]
+
+    # created < d
+    def before(self, d: Dateish) -> List['Org']:
+        return self.nodes[:bisect_left(self._keys, _as_datetime(d))]
+
+    # created > d
+    def after(self, d: Dateish) -> List['Org']:
+        return self.nodes[bisect_right(self._keys, _as_datetime(d)):]
+
+    # most recent first
+    def latest(self, n: int) -> List['Org']:
+        if n <= 0:
+            return []
+        return self.nodes[-n:][::-1]
+
+    def __repr__(self):
+        return f'DateIndex{{nodes={len(self.nodes)}}}'
+
+
+class CacheStats:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return 0.0 if total == 0 else self.hits / total
+
+    def __repr__(self):
+        return f'CacheStats{{hits={self.hits}, misses={self.misses}}}'
+
+
+class _QueryCache:
+    def __init__(self, size: int) -> None:
+        self.stats = CacheStats()
+        self.size = size
+        self._results: 'OrderedDict[Tuple, List[Any]]' = OrderedDict()
+
+    def invalidate(self) -> None:
+        self._results.clear()
+
+    def resize(self, size: int) -> None:
+        self.size = size
+        while len(self._results) > size:
+            self._results.popitem(last=False)
+
+    def get(self, key: Tuple, compute: Callable[[], List[Any]]) -> List[Any]:
+        res = self._results.get(key)
+        if res is not None:
+            self.stats.hits += 1
+            self._results.move_to_end(key)
+            return res
+        self.stats.misses += 1
+        res = compute()
+        if self.size > 0:
+            self._results[key] = res
+            if len(self._results) > self.size:
+                self._results.popitem(last=False) # least recently used
+        return res
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+
+# fields of Org that end up in the XML, in the same layout Hiccup produces:
+# scalars as text, collections as one child element per item, nested Org/OrgTable as 'org'/'table' elements
+_XML_FIELDS = (
+    'heading',
+    'tags',
+    'self_tags',
+    'level',
+    'properties',
+    'created',
+    'body',
+    'contents',
+    'children',
+    'file_settings',
+)
+
+_XPATH_TOKEN = re.compile(r'''
+  (?P<str>"[^"]*"|'[^']*')
+| (?P<op>//|::|\.\.|!=|<=|>=|[/@()\[\],|=<>+.*$-])
+| (?P<name>[A-Za-z_][\w.-]*)
+| (?P<num>\d+(\.\d*)?)
+| (?P<ws>\s+)
+''', re.VERBOSE)
+
+# tokens after which '*' is a name test rather than multiplication
+_XPATH_WILDCARD_AFTER = {None, '/', '//', '(', '[', ',', '|', '@', '::', '=', '!=', '<', '>', '<=', '>=', '+', '-', 'and', 'or', 'div', 'mod'}
+
+_XPATH_OPERATORS = {'and', 'or', 'div', 'mod'}
+
+# best effort: returns the subset of _XML_FIELDS the query might reach
+# anything it can't account for (wildcards under org, '.', string(), names that aren't fields) results in all fields
+def _xpath_fields(q: str) -> Set[str]:
+    tokens: List[Tuple[str, str]] = []
+    for m in _XPATH_TOKEN.finditer(q):
+        kind = m.lastgroup
+        if kind != 'ws':
+            tokens.append((kind, m.group(0))) # type: ignore
+
+    everything = set(_XML_FIELDS)
+    res = {'children'} # otherwise we can't descend
+    under_field = False # whether the previous name step was a field or something inside it
+    for i, (kind, tok) in enumerate(tokens):
+        prev = tokens[i - 1][1] if i > 0 else None
+        nxt  = tokens[i + 1][1] if i + 1 < len(tokens) else None
+        if kind != 'name' and tok != '/':
+            under_field = False
+        if kind == 'name':
+            if nxt == '(':
+                if tok in ('node', 'string', 'normalize-space', 'string-length') and i + 2 < len(tokens) and tokens[i + 2][1] == ')':
+                    return everything # string value of the context node
+                continue
+            if nxt == '::' or prev == '@' or tok in _XPATH_OPERATORS:
+                continue
+            if tok in _XML_FIELDS:
+                res.add(tok)
+                under_field = True
+            elif tok in ('org', 'root', 'table'):
+                if tok == 'table':
+                    res.add('contents')
+                under_field = False
+            elif prev == '/' and under_field:
+                pass # e.g. properties/CREATED or tags/str
+            else:
+                return everything # e.g. //CREATED, could be anywhere
+        elif tok == '.' and nxt not in ('/', '//'):
+            return everything
+        elif tok == '*' and prev in _XPATH_WILDCARD_AFTER:
+            # fine as long as it's scoped under a field, e.g. tags/*
+            step = tokens[i - 2][1] if prev in ('/', '//') and i >= 2 else None
+            if prev == '@':
+                continue
+            if prev == '/' and step in _XML_FIELDS:
+                continue
+            return everything
+    return res
+
+
+# attribute pointing back at the python value of the element
+_XML_ID = '_pid'
+
+# standalone copies of the elements of non-root nodes that were queried, least recently used ones are dropped
+_SUBDOCS_SIZE = 16
+
+
+class _XmlCache:
+    def __init__(self) -> None:
+        self.stats = CacheStats()
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        self._xml = None
+        self._fields: Set[str] = set()
+        self._objects: List[Any] = []
+        self._elements: Dict[Any, Any] = {} # orgparse node -> element
+        self._subdocs: 'OrderedDict[Any, Any]' = OrderedDict() # orgparse node -> standalone copy of its element
+
+    def _keep(self, el, o: Any) -> None:
+        el.set(_XML_ID, str(len(self._objects)))
+        self._objects.append(o)
+
+    def _add_value(self, parent, name: str, v) -> None:
+        if isinstance(v, Org):
+            parent.append(self._org_element(v))
+            return
+        el = etree.SubElement(parent, 'table' if isinstance(v, OrgTable) else name)
+        self._keep(el, v)
+        if v is None or isinstance(v, (date, OrgTable)):
+            pass # Hiccup config excludes everything inside dates and tables, so they are empty elements
+        elif isinstance(v, dict):
+            for k, x in v.items():
+                try:
+                    self._add_value(el, k, x)
+                except ValueError: # not a valid xml tag name
+                    item = etree.SubElement(el, 'item', key=k)
+                    self._keep(item, x)
+                    item.text = str(x)
+        elif isinstance(v, (list, set, tuple)):
+            for x in (sorted(v) if isinstance(v, set) else v):
+                self._add_value(el, type(x).__name__, x)
+        else:
+            el.text = str(v)
+
+    def _org_element(self, o: 'Org'):
+        el = etree.Element('root' if o.is_root() else 'org')
+        self._keep(el, o)
+        self._elements[o.node] = el
+        for f in _XML_FIELDS:
+            if f in self._fields:
+                self._add_value(el, f, getattr(o, f))
+        return el
+
+    def _document(self, org: 'Org', fields: FrozenSet[str]):
+        missing = fields - self._fields
+        if self._xml is None:
+            self.stats.misses += 1
+            self._fields = set(fields)
+            self._xml = self._org_element(org._root)
+        elif len(missing) > 0:
+            # extend the existing document rather than redoing it
+            self.stats.misses += 1
+            self._fields.update(missing)
+            for el in list(self._elements.values()):
+                o = self._objects[int(el.get(_XML_ID))]
+                for f in _XML_FIELDS:
+                    if f in missing:
+                        self._add_value(el, f, getattr(o, f))
+            self._subdocs.clear()
+        else:
+            self.stats.hits += 1
+
+        if org.is_root():
+            return self._xml
+        sub = self._subdocs.get(org.node)
+        if sub is None:
+            el = self._elements.get(org.node)
+            if el is None:
+                # not reachable from the root (removed by update_from_string, iter_file entries), so serialized separately
+                el = self._org_element(org)
+            # the copy keeps the object ids, and the query is evaluated as if the node was the top level, like with Hiccup
+            import copy
+            sub = copy.deepcopy(el)
+            sub.tag = 'root'
+            self._subdocs[org.node] = sub
+            if len(self._subdocs) > _SUBDOCS_SIZE:
+                self._subdocs.popitem(last=False)
+        else:
+            self._subdocs.move_to_end(org.node)
+        return sub
+
+    def xfind_all(self, org: 'Org', q: CompiledQuery) -> List[Any]:
+        prof = org.profile
+        with _phase(prof, 'serialize'):
+            doc = self._document(org, q.fields)
+        with _phase(prof, 'query'):
+            found = q._xpath(doc)
+        res = []
+        for x in found:
+            if isinstance(x, etree._Element):
+                res.append(self._objects[int(x.get(_XML_ID))])
+            else: # strings/numbers from text() and such
+                res.append(x)
+        return res
 
 
-__all__ = ['Org', 'OrgTable', 'parse_org_date']
+__all__ = ['Org', 'OrgTable', 'Block', 'Changes', 'Span', 'TagIndex', 'DateIndex', 'CacheStats', 'Profile', 'CompiledQuery', 'compile_query', 'parse_org_date', 'parse_org_dates', 'register_date_format']
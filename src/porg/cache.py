@@ -0,0 +1,125 @@
+# on disk cache of parsed files, used by Org.from_file(cache_dir=...)
+# an entry is reused if the file has the same size and mtime, or failing that, the same content hash
+# the pickled orgparse tree is an order of magnitude faster to load than parsing the file again
+from functools import lru_cache
+import hashlib
+import os
+from pathlib import Path
+import pickle
+from typing import Any, Dict, Optional, Union
+
+import orgparse # type: ignore
+
+
+PathIsh = Union[Path, str]
+
+# bump when the layout of the entries changes
+FORMAT_VERSION = 1
+
+
+@lru_cache(1)
+def _versions() -> Dict[str, Any]:
+    from . import __version__
+    try:
+        from pkg_resources import get_distribution
+        orgparse_version = get_distribution('orgparse').version
+    except Exception:
+        orgparse_version = 'unknown'
+    # entries written by a different porg/orgparse are ignored
+    return {
+        'format': FORMAT_VERSION,
+        'porg': __version__,
+        'orgparse': orgparse_version,
+    }
+
+
+def _hash(path: Path) -> str:
+    h = hashlib.sha1()
+    with path.open('rb') as fo:
+        for chunk in iter(lambda: fo.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ParseCache:
+    def __init__(self, cache_dir: PathIsh) -> None:
+        from . import CacheStats
+        self.cache_dir = Path(cache_dir)
+        self.stats = CacheStats()
+
+    def _entry(self, path: Path) -> Path:
+        key = hashlib.sha1(str(path.resolve()).encode('utf8')).hexdigest()
+        return self.cache_dir / (key + '.pickle')
+
+    def _read(self, entry: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with entry.open('rb') as fo:
+                header = pickle.load(fo)
+                if header.get('versions') != _versions():
+                    return None
+                header['tree'] = pickle.load(fo)
+                return header
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # corrupt or incompatible entry, will be overwritten
+            return None
+
+    def _write(self, entry: Path, header: Dict[str, Any], tree) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp.open('wb') as fo:
+            pickle.dump(header, fo, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(tree, fo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, entry) # atomic, so concurrent readers never see partial entries
+
+    # returns orgparse root node
+    def load(self, fname: PathIsh):
+        path = Path(fname)
+        entry = self._entry(path)
+        st = path.stat()
+
+        cached = self._read(entry)
+        if cached is not None:
+            if (cached['size'], cached['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+                self.stats.hits += 1
+                return cached['tree']
+            sha = _hash(path)
+            if cached['sha1'] == sha:
+                # touched, but not changed
+                self.stats.hits += 1
+                tree = cached.pop('tree')
+                cached.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+                self._write(entry, cached, tree)
+                return tree
+        else:
+            sha = _hash(path)
+
+        self.stats.misses += 1
+        tree = orgparse.loads(path.read_text())
+        header = {
+            'versions': _versions(),
+            'path'    : str(path),
+            'size'    : st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha1'    : sha,
+        }
+        self._write(entry, header, tree)
+        return tree
+
+    def clear(self) -> None:
+        for entry in self.cache_dir.glob('*.pickle'):
+            entry.unlink()
+
+
+@lru_cache(None)
+def _get_cache(cache_dir: Path) -> ParseCache:
+    # shared between from_file calls, mostly so the stats make sense
+    return ParseCache(cache_dir)
+
+
+def get_cache(cache_dir: PathIsh) -> ParseCache:
+    return _get_cache(Path(cache_dir))
+
+
+__all__ = ['ParseCache', 'get_cache', 'FORMAT_VERSION']
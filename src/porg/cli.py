@@ -0,0 +1,271 @@
+# porg command line: porg index|query|tags|export NOTES_DIR ...
+# keeps a persistent index of the directory: flat records for every node (for tags/native queries, which don't need the trees)
+# and parsed trees in porg.cache format (for xpath queries and export). Files are only reparsed if their size/mtime changed
+import argparse
+from datetime import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+import pickle
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import Org, compile_query, get_logger, parse_org_date
+from .query import _as_datetime
+
+
+# stored for every node, enough for tags/native queries and for printing results
+_RECORD_FIELDS = ('heading', 'level', 'tags', 'self_tags', 'properties', 'created', 'linenumber')
+
+
+def default_index_dir(notes: Path) -> Path:
+    base = Path(os.environ.get('XDG_CACHE_HOME', '~/.cache')).expanduser()
+    key = hashlib.sha1(str(notes.resolve()).encode('utf8')).hexdigest()[:16]
+    return base / 'porg' / key
+
+
+class Index:
+    def __init__(self, notes: Path, index_dir: Optional[Path]=None, pattern: str='**/*.org') -> None:
+        self.notes = notes
+        self.pattern = pattern
+        self.index_dir = default_index_dir(notes) if index_dir is None else index_dir
+        self.cache_dir = self.index_dir / 'trees'
+        # relative path -> {'size', 'mtime_ns', 'records'}
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def _manifest(self) -> Path:
+        return self.index_dir / 'index.pickle'
+
+    def _load(self) -> None:
+        from .cache import _versions
+        try:
+            with self._manifest.open('rb') as fo:
+                data = pickle.load(fo)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            get_logger().warning('ignoring broken index %s: %s', self._manifest, e)
+            return
+        if data.get('versions') != _versions() or data.get('pattern') != self.pattern:
+            return
+        self.files = data['files']
+
+    def _save(self) -> None:
+        from .cache import _versions
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._manifest.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp.open('wb') as fo:
+            pickle.dump({'versions': _versions(), 'pattern': self.pattern, 'files': self.files}, fo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._manifest)
+
+    # returns (updated, removed)
+    def refresh(self) -> Tuple[List[str], List[str]]:
+        self._load()
+        current = {str(p.relative_to(self.notes)): p for p in sorted(self.notes.glob(self.pattern)) if p.is_file()}
+        removed = [rel for rel in self.files if rel not in current]
+        for rel in removed:
+            del self.files[rel]
+
+        updated: List[str] = []
+        for rel, path in current.items():
+            st = path.stat()
+            entry = self.files.get(rel)
+            if entry is not None and (entry['size'], entry['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+                continue
+            try:
+                org = Org.from_file(path, cache_dir=self.cache_dir)
+                records = org.to_records(_RECORD_FIELDS)
+            except Exception as e:
+                get_logger().warning('failed to index %s: %s', path, e)
+                self.files.pop(rel, None)
+                continue
+            self.files[rel] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'records': records}
+            updated.append(rel)
+
+        if len(updated) > 0 or len(removed) > 0 or not self._manifest.exists():
+            self._save()
+        return (updated, removed)
+
+    def records(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for rel, entry in self.files.items():
+            for rec in entry['records']:
+                yield (rel, rec)
+
+    # trees come from the parse cache, so unchanged files aren't reparsed
+    def trees(self) -> Iterator[Tuple[str, Org]]:
+        for rel in self.files:
+            yield (rel, Org.from_file(self.notes / rel, cache_dir=self.cache_dir))
+
+
+def _parse_date(s: str) -> datetime:
+    return _as_datetime(parse_org_date(s))
+
+
+# native queries run against the stored records, all of the conditions have to match
+def _record_filter(args) -> Any:
+    tags = args.tag or []
+    heading = args.heading
+    level = args.level
+    after = None if args.after is None else _parse_date(args.after)
+    before = None if args.before is None else _parse_date(args.before)
+
+    def matches(rec: Dict[str, Any]) -> bool:
+        if any(t not in rec['tags'] for t in tags):
+            return False
+        if heading is not None and heading not in rec['heading']:
+            return False
+        if level is not None and rec['level'] != level:
+            return False
+        if after is not None or before is not None:
+            c = rec['created']
+            if c is None:
+                return False
+            c = _as_datetime(c)
+            if after is not None and not c > after:
+                return False
+            if before is not None and not c < before:
+                return False
+        return True
+    return matches
+
+
+def _json_default(v):
+    if isinstance(v, (set, frozenset)):
+        return sorted(v)
+    if hasattr(v, 'isoformat'):
+        return v.isoformat()
+    raise TypeError(f"Can't serialize {v!r}")
+
+
+def _print_hit(out, args, rel: str, rec: Dict[str, Any]) -> None:
+    if args.json:
+        out.write(json.dumps(dict(path=rel, **rec), default=_json_default, ensure_ascii=False) + '\n')
+    else:
+        # same as grep -n, so editors can jump to it
+        out.write(f"{rel}:{rec['linenumber']}:{rec['heading']}\n")
+
+
+def cmd_index(index: Index, args, out) -> int:
+    (updated, removed) = index.refresh()
+    nodes = sum(len(e['records']) for e in index.files.values())
+    out.write(f'{len(index.files)} files, {nodes} nodes ({len(updated)} updated, {len(removed)} removed)\n')
+    return 0
+
+
+def cmd_query(index: Index, args, out) -> int:
+    index.refresh()
+    found = 0
+    if args.xpath is not None:
+        q = compile_query(args.xpath)
+        from .export import _record
+        for rel, org in index.trees():
+            for o in org.xpath_all(q):
+                if not isinstance(o, Org):
+                    out.write(f'{rel}:{o}\n') # text() and such
+                elif o.is_root():
+                    # the file itself, e.g. '/root'; it has no heading, so just the path
+                    out.write(json.dumps({'path': rel}) + '\n' if args.json else f'{rel}:0:\n')
+                else:
+                    _print_hit(out, args, rel, _record(o, o.tags, o.self_tags, _RECORD_FIELDS))
+                found += 1
+    else:
+        matches = _record_filter(args)
+        for rel, rec in index.records():
+            if matches(rec):
+                _print_hit(out, args, rel, rec)
+                found += 1
+    return 0 if found > 0 else 1
+
+
+def cmd_tags(index: Index, args, out) -> int:
+    index.refresh()
+    key = 'self_tags' if args.own else 'tags'
+    counts: Dict[str, int] = {}
+    for _, rec in index.records():
+        for t in rec[key]:
+            counts[t] = counts.get(t, 0) + 1
+    for t, c in sorted(counts.items(), key=lambda tc: (-tc[1], tc[0])):
+        out.write(f'{c}\t{t}\n')
+    return 0
+
+
+def cmd_export(index: Index, args, out) -> int:
+    from .export import FIELDS, _csv_value
+    import csv
+
+    fields: Sequence[str] = args.fields.split(',') if args.fields else ('heading', 'level', 'tags', 'properties', 'created')
+    for f in fields:
+        if f not in FIELDS:
+            raise RuntimeError(f'Unknown field {f!r}, expected one of {FIELDS}')
+    index.refresh()
+
+    if all(f in _RECORD_FIELDS for f in fields):
+        # no need for the trees
+        rows: Iterator[Tuple[str, Dict[str, Any]]] = index.records()
+    else:
+        rows = ((rel, rec) for rel, org in index.trees() for rec in org.iter_records(fields))
+
+    if args.format == 'csv':
+        w = csv.writer(out)
+        w.writerow(['path', *fields])
+        for rel, rec in rows:
+            w.writerow([rel, *(_csv_value(rec[f]) for f in fields)])
+    else:
+        for rel, rec in rows:
+            d = {'path': rel}
+            d.update((f, rec[f]) for f in fields)
+            out.write(json.dumps(d, default=_json_default, ensure_ascii=False) + '\n')
+    return 0
+
+
+def make_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog='porg', description='Query a directory of org-mode files')
+    p.add_argument('--index-dir', type=Path, help='where to keep the index (default: $XDG_CACHE_HOME/porg/...)')
+    p.add_argument('--pattern', default='**/*.org', help='files to index, relative to the notes directory')
+    sp = p.add_subparsers(dest='command')
+    sp.required = True
+
+    def add(name: str, f, help: str) -> argparse.ArgumentParser:
+        cp = sp.add_parser(name, help=help)
+        cp.add_argument('notes', type=Path, help='notes directory')
+        cp.set_defaults(func=f)
+        return cp
+
+    add('index', cmd_index, 'create/refresh the index')
+
+    qp = add('query', cmd_query, 'find nodes, prints path:line:heading (exit code 1 if nothing was found)')
+    qp.add_argument('--xpath', help='xpath query against the trees; otherwise the conditions below are used')
+    qp.add_argument('--tag', action='append', help='has the tag (including inherited ones), can be repeated')
+    qp.add_argument('--heading', help='heading contains')
+    qp.add_argument('--level', type=int)
+    qp.add_argument('--after', help='created after, e.g. 2019-01-01')
+    qp.add_argument('--before', help='created before')
+    qp.add_argument('--json', action='store_true', help='print matching nodes as json lines')
+
+    tp = add('tags', cmd_tags, 'tag counts')
+    tp.add_argument('--own', action='store_true', help="don't count inherited tags")
+
+    ep = add('export', cmd_export, 'every node as json lines/csv')
+    ep.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    ep.add_argument('--fields', help='comma separated, see porg.export.FIELDS')
+    return p
+
+
+def main(argv: Optional[List[str]]=None) -> int:
+    args = make_parser().parse_args(argv)
+    notes: Path = args.notes
+    if not notes.is_dir():
+        sys.stderr.write(f'{notes} is not a directory\n')
+        return 2
+    index = Index(notes, index_dir=args.index_dir, pattern=args.pattern)
+    try:
+        return args.func(index, args, sys.stdout)
+    except RuntimeError as e:
+        sys.stderr.write(f'porg: {e}\n')
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# many org files loaded together, e.g. a notes directory
+# parsing is CPU bound, so files are parsed in a process pool and the trees are sent back pickled
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from glob import glob
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from . import CompiledQuery, Org, compile_query, get_logger
+
+
+PathIsh = Union[Path, str]
+
+
+class Hit(NamedTuple):
+    path: Path
+    org: Org
+
+
+def _is_glob(s: str) -> bool:
+    return any(c in s for c in '*?[')
+
+
+def _resolve(source: Union[PathIsh, Iterable[PathIsh]], pattern: str) -> List[Path]:
+    if isinstance(source, (str, Path)):
+        if isinstance(source, str) and _is_glob(source):
+            return sorted(Path(p) for p in glob(source, recursive=True))
+        p = Path(source)
+        if p.is_dir():
+            return sorted(p.glob(pattern))
+        return [p]
+    return [Path(p) for p in source]
+
+
+# module level, so it can be pickled for the pool
+def _load(path: Path, cache_dir: Optional[PathIsh]=None) -> Tuple[Path, Optional[Org], Optional[Exception]]:
+    try:
+        return (path, Org.from_file(path, cache_dir=cache_dir), None)
+    except Exception as e:
+        return (path, None, e)
+
+
+class OrgCorpus:
+    # workers: None means os.cpu_count(); 0 or 1 parses in the current process
+    # cache_dir: passed on to Org.from_file
+    def __init__(
+            self,
+            source: Union[PathIsh, Iterable[PathIsh]],
+            pattern: str='**/*.org',
+            workers: Optional[int]=None,
+            cache_dir: Optional[PathIsh]=None,
+    ) -> None:
+        self._setup(source, pattern, cache_dir)
+        self._add_results(self._load_all(workers))
+
+    def _setup(self, source: Union[PathIsh, Iterable[PathIsh]], pattern: str, cache_dir: Optional[PathIsh]) -> None:
+        self.cache_dir = cache_dir
+        self.paths: List[Path] = _resolve(source, pattern)
+        self.files: Dict[Path, Org] = {}
+        self.errors: Dict[Path, Exception] = {}
+        self._search_index = None
+
+    def _add_results(self, results: Iterable[Tuple[Path, Optional[Org], Optional[Exception]]]) -> None:
+        for path, org, err in results:
+            if err is not None:
+                get_logger().warning('failed to load %s: %s', path, err)
+                self.errors[path] = err
+            else:
+                assert org is not None
+                self.files[path] = org
+
+    # async version of the constructor, for use from an event loop: files are parsed in the executor
+    # (None means the loop's default thread pool; a ProcessPoolExecutor works too) with at most concurrency of them in flight,
+    # so loading a large directory doesn't hog the executor and other requests still get a chance
+    @classmethod
+    async def aload(
+            cls,
+            source: Union[PathIsh, Iterable[PathIsh]],
+            pattern: str='**/*.org',
+            concurrency: int=8,
+            executor: Optional[Executor]=None,
+            cache_dir: Optional[PathIsh]=None,
+    ) -> 'OrgCorpus':
+        res = cls.__new__(cls)
+        res._setup(source, pattern, cache_dir)
+        loop = asyncio.get_event_loop()
+        sem = asyncio.Semaphore(concurrency)
+        load = partial(_load, cache_dir=cache_dir)
+
+        async def load_one(path: Path):
+            async with sem:
+                return await loop.run_in_executor(executor, load, path)
+
+        res._add_results(await asyncio.gather(*(load_one(p) for p in res.paths)))
+        return res
+
+    def _load_all(self, workers: Optional[int]):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(self.paths))
+        load = partial(_load, cache_dir=self.cache_dir)
+        if workers <= 1:
+            return [load(p) for p in self.paths]
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, len(self.paths) // (workers * 4))
+                return list(pool.map(load, self.paths, chunksize=chunksize))
+        except (OSError, NotImplementedError) as e:
+            # e.g. no working multiprocessing on the platform
+            get_logger().warning("couldn't use process pool (%s), loading serially", e)
+            return [load(p) for p in self.paths]
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __getitem__(self, path: PathIsh) -> Org:
+        return self.files[Path(path)]
+
+    def iterate(self) -> Iterator[Hit]:
+        for path, org in self.files.items():
+            for o in org.iterate():
+                yield Hit(path, o)
+
+    def _collect(self, f: Callable[[Org], List[Org]]) -> List[Hit]:
+        return [Hit(path, o) for path, org in self.files.items() for o in f(org)]
+
+    def query(self, pred: Callable[[Org], bool]) -> List[Hit]:
+        return self._collect(lambda org: org.query(pred))
+
+    def with_tag(self, tag: str, with_inherited=True) -> List[Hit]:
+        return self._collect(lambda org: org.with_tag(tag, with_inherited=with_inherited))
+
+    def xpath_all(self, q: Union[str, CompiledQuery]) -> List[Hit]:
+        cq = q if isinstance(q, CompiledQuery) else compile_query(q) # once for all files
+        return self._collect(lambda org: org.xpath_all(cq))
+
+    # full text index over all files, built on first use; see porg.search
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            from .search import SearchIndex
+            self._search_index = SearchIndex.from_corpus(self)
+        return self._search_index
+
+    def search(self, query: str, limit: Optional[int]=10, prefix=False) -> List[Hit]:
+        paths = {org: path for path, org in self.files.items()}
+        return [Hit(paths[r.org._root], r.org) for r in self.search_index.search(query, limit=limit, prefix=prefix)]
+
+    def __repr__(self):
+        return f'OrgCorpus{{files={len(self.files)}, errors={len(self.errors)}}}'
+
+
+__all__ = ['OrgCorpus', 'Hit']
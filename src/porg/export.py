@@ -0,0 +1,145 @@
+# flat per-node records (e.g. for analytics), computed in a single traversal over the tree
+# compared to iterate() and then asking each node for its properties, inherited tags are computed top down
+# rather than walking up from every node, and the heading is only parsed once for both heading and created
+# usage: write_ndjson(org, sys.stdout, fields=('heading', 'tags', 'created'))
+import csv
+import json
+from datetime import date
+from typing import Any, Dict, IO, Iterable, Iterator, List, Sequence, Set, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import Org
+
+
+FIELDS = (
+    'heading',
+    'level',
+    'tags',       # including inherited ones and FILETAGS, sorted
+    'self_tags',  # sorted
+    'properties',
+    'created',
+    'body',
+    'linenumber',
+)
+
+DEFAULT_FIELDS = ('heading', 'level', 'tags', 'properties', 'created')
+
+
+def _check_fields(fields: Sequence[str]) -> None:
+    for f in fields:
+        if f not in FIELDS:
+            raise RuntimeError(f'Unknown field {f!r}, expected one of {FIELDS}')
+
+
+def _record(o: 'Org', tags: Set[str], own: Set[str], fields: Sequence[str]) -> Dict[str, Any]:
+    from . import parse_org_date
+    rec: Dict[str, Any] = {}
+    pre = None
+    for f in fields:
+        if f in ('heading', 'created') and pre is None:
+            pre = o._preheading
+        if f == 'heading':
+            v: Any = pre[0].strip()
+        elif f == 'level':
+            v = o.node.level
+        elif f == 'tags':
+            v = sorted(tags)
+        elif f == 'self_tags':
+            v = sorted(own)
+        elif f == 'properties':
+            v = o.properties
+        elif f == 'created':
+            # same as Org.created
+            cs = o.properties.get('CREATED')
+            if cs is None:
+                cs = pre[1]
+            try:
+                v = None if cs is None else parse_org_date(cs)
+            except Exception as e:
+                o._throw(e)
+        elif f == 'body':
+            v = o.body
+        else: # linenumber
+            v = o.linenumber
+        rec[f] = v
+    return rec
+
+
+# same nodes as Org.iterate
+def iter_records(org: 'Org', fields: Iterable[str]=DEFAULT_FIELDS) -> Iterator[Dict[str, Any]]:
+    fields = tuple(fields)
+    _check_fields(fields) # upfront, rather than on the first next()
+    return _iter_records(org, fields)
+
+
+def _iter_records(org: 'Org', fields: Sequence[str]) -> Iterator[Dict[str, Any]]:
+    def walk(o: 'Org', inherited: Set[str]) -> Iterator[Dict[str, Any]]:
+        for c in o._get_children():
+            own = c.self_tags
+            tags = inherited | own
+            yield _record(c, tags, own, fields)
+            yield from walk(c, tags)
+
+    if org.is_root():
+        yield from walk(org, org._filetags)
+    else:
+        tags = org.tags
+        yield _record(org, tags, org.self_tags, fields)
+        yield from walk(org, tags)
+
+
+def to_records(org: 'Org', fields: Iterable[str]=DEFAULT_FIELDS) -> List[Dict[str, Any]]:
+    return list(iter_records(org, fields))
+
+
+def to_columns(org: 'Org', fields: Iterable[str]=DEFAULT_FIELDS) -> Dict[str, List[Any]]:
+    fields = tuple(fields)
+    res: Dict[str, List[Any]] = {f: [] for f in fields}
+    cols = [(f, res[f]) for f in fields]
+    for rec in iter_records(org, fields):
+        for f, col in cols:
+            col.append(rec[f])
+    return res
+
+
+def _json_default(v):
+    if isinstance(v, date):
+        return v.isoformat()
+    raise TypeError(f"Can't serialize {v!r}")
+
+
+# one json object per line, written as the tree is traversed; returns the number of records
+def write_ndjson(org: 'Org', fo: IO[str], fields: Iterable[str]=DEFAULT_FIELDS) -> int:
+    n = 0
+    for rec in iter_records(org, fields):
+        fo.write(json.dumps(rec, default=_json_default, ensure_ascii=False))
+        fo.write('\n')
+        n += 1
+    return n
+
+
+def _csv_value(v):
+    if v is None:
+        return ''
+    if isinstance(v, list): # tags
+        return ':' + ':'.join(v) + ':' if len(v) > 0 else ''
+    if isinstance(v, dict):
+        return json.dumps(v, ensure_ascii=False)
+    if isinstance(v, date):
+        return v.isoformat()
+    return v
+
+
+# header row with the field names, then one row per node; tags are in the org :a:b: format, properties as json
+def write_csv(org: 'Org', fo: IO[str], fields: Iterable[str]=DEFAULT_FIELDS) -> int:
+    fields = tuple(fields)
+    w = csv.writer(fo)
+    w.writerow(fields)
+    n = 0
+    for rec in iter_records(org, fields):
+        w.writerow([_csv_value(rec[f]) for f in fields])
+        n += 1
+    return n
+
+
+__all__ = ['FIELDS', 'DEFAULT_FIELDS', 'iter_records', 'to_records', 'to_columns', 'write_ndjson', 'write_csv']
@@ -0,0 +1,114 @@
+# opt-in instrumentation, per root: call counts and cumulative time of the expensive phases
+# usage: org.enable_profiling(); ...; print(org.profile) or org.profile.log()
+# when disabled, instrumented code only pays for checking the root's profile is None
+# phases can nest (e.g. query -> date_parse if a predicate looks at created), then the time counts towards both
+from functools import wraps
+import logging
+from time import perf_counter
+from typing import Callable, Dict, Optional, TypeVar
+
+
+PHASES = (
+    'parse',       # orgparse (from_string/from_file/update_from_string)
+    'serialize',   # building XML for xpath_all (with Hiccup, the whole xpath_all call)
+    'query',       # XPath evaluation, query(), with_tag()
+    'date_parse',  # created timestamps
+    'table_parse', # OrgTable layout and columns
+)
+
+
+class PhaseStats:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total = 0.0 # seconds
+
+    @property
+    def mean(self) -> float:
+        return 0.0 if self.calls == 0 else self.total / self.calls
+
+    def __repr__(self):
+        return f'PhaseStats{{calls={self.calls}, total={self.total:.6f}}}'
+
+
+class _Timer:
+    __slots__ = ('stats', 'start')
+
+    def __init__(self, stats: PhaseStats) -> None:
+        self.stats = stats
+
+    def __enter__(self) -> None:
+        self.start = perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.stats.calls += 1
+        self.stats.total += perf_counter() - self.start
+
+
+class Profile:
+    def __init__(self) -> None:
+        self.phases: Dict[str, PhaseStats] = {p: PhaseStats() for p in PHASES}
+
+    def phase(self, name: str) -> _Timer:
+        return _Timer(self.phases[name])
+
+    def record(self, name: str, elapsed: float) -> None:
+        st = self.phases[name]
+        st.calls += 1
+        st.total += elapsed
+
+    def reset(self) -> None:
+        for st in self.phases.values():
+            st.calls = 0
+            st.total = 0.0
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return {p: {'calls': st.calls, 'total': st.total} for p, st in self.phases.items()}
+
+    def log(self, level: int=logging.INFO) -> None:
+        from . import get_logger
+        logger = get_logger()
+        for p, st in self.phases.items():
+            if st.calls > 0:
+                logger.log(level, 'profile: %-11s %8d calls %10.3fms total %8.3fms mean', p, st.calls, st.total * 1000, st.mean * 1000)
+
+    def __repr__(self):
+        return 'Profile{{{}}}'.format(', '.join(f'{p}={st.calls}/{st.total:.6f}s' for p, st in self.phases.items()))
+
+
+class _NoTimer:
+    # contextlib.nullcontext is 3.7+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NOOP = _NoTimer()
+
+
+def _phase(prof: Optional[Profile], name: str):
+    return _NOOP if prof is None else prof.phase(name)
+
+
+F = TypeVar('F', bound=Callable)
+
+
+# for Org methods
+def _profiled(name: str) -> Callable[[F], F]:
+    assert name in PHASES, name
+    def deco(f):
+        @wraps(f)
+        def wrapper(self, *args, **kwargs):
+            prof = self.profile
+            if prof is None:
+                return f(self, *args, **kwargs)
+            with prof.phase(name):
+                return f(self, *args, **kwargs)
+        return wrapper
+    return deco # type: ignore
+
+
+__all__ = ['Profile', 'PhaseStats', 'PHASES']
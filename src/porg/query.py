@@ -0,0 +1,117 @@
+# native queries: predicates are evaluated directly against Org nodes during a single traversal,
+# so unlike xpath_all nothing gets serialized to XML
+# usage: org.query(has_tag('x') & ~heading_contains('draft'))
+import re
+from datetime import datetime, date, time
+from typing import Callable, Optional, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import Org
+
+
+Dateish = Union[datetime, date]
+
+
+def _as_datetime(d: Dateish) -> datetime:
+    # datetime vs date comparison raises TypeError, so dates are treated as midnight
+    if isinstance(d, datetime):
+        return d
+    return datetime.combine(d, time.min)
+
+
+# desc should identify what the predicate does, it's used as the key by Org's query cache
+class Pred:
+    def __init__(self, fn: Callable[['Org'], bool], desc: str) -> None:
+        self.fn = fn
+        self.desc = desc
+
+    def __call__(self, o: 'Org') -> bool:
+        return self.fn(o)
+
+    def __and__(self, other: 'Pred') -> 'Pred':
+        return Pred(lambda o: self(o) and other(o), f'({self.desc} & {other.desc})')
+
+    def __or__(self, other: 'Pred') -> 'Pred':
+        return Pred(lambda o: self(o) or other(o), f'({self.desc} | {other.desc})')
+
+    def __invert__(self) -> 'Pred':
+        return Pred(lambda o: not self(o), f'~{self.desc}')
+
+    def __repr__(self):
+        return 'Pred{{{}}}'.format(self.desc)
+
+
+ANY = Pred(lambda o: True, 'any')
+
+
+def heading_is(s: str) -> Pred:
+    return Pred(lambda o: o.heading == s, f'heading_is({s!r})')
+
+
+def heading_contains(s: str) -> Pred:
+    return Pred(lambda o: s in o.heading, f'heading_contains({s!r})')
+
+
+def heading_matches(regex: str, flags=0) -> Pred:
+    rx = re.compile(regex, flags)
+    desc = f'heading_matches({regex!r})' if flags == 0 else f'heading_matches({regex!r}, {int(flags)})'
+    return Pred(lambda o: rx.search(o.heading) is not None, desc)
+
+
+def has_tag(tag: str) -> Pred:
+    return Pred(lambda o: tag in o.tags, f'has_tag({tag!r})')
+
+
+def has_self_tag(tag: str) -> Pred:
+    return Pred(lambda o: tag in o.self_tags, f'has_self_tag({tag!r})')
+
+
+def has_property(name: str, value: Optional[str]=None) -> Pred:
+    if value is None:
+        return Pred(lambda o: name in o.properties, f'has_property({name!r})')
+    return Pred(lambda o: o.properties.get(name) == value, f'has_property({name!r}, {value!r})')
+
+
+def level_is(n: int) -> Pred:
+    return Pred(lambda o: o.level == n, f'level_is({n})')
+
+
+def level_between(lo: int, hi: int) -> Pred:
+    # inclusive on both ends
+    return Pred(lambda o: lo <= o.level <= hi, f'level_between({lo}, {hi})')
+
+
+def has_created() -> Pred:
+    return Pred(lambda o: o.created is not None, 'has_created()')
+
+
+def _created_pred(check: Callable[[datetime], bool], desc: str) -> Pred:
+    def pred(o: 'Org') -> bool:
+        c = o.created
+        return c is not None and check(_as_datetime(c))
+    return Pred(pred, desc)
+
+
+def created_before(d: Dateish) -> Pred:
+    dt = _as_datetime(d)
+    return _created_pred(lambda c: c < dt, f'created_before({d})')
+
+
+def created_after(d: Dateish) -> Pred:
+    dt = _as_datetime(d)
+    return _created_pred(lambda c: c > dt, f'created_after({d})')
+
+
+def created_between(start: Dateish, end: Dateish) -> Pred:
+    # half-open: start <= created < end
+    s, e = _as_datetime(start), _as_datetime(end)
+    return _created_pred(lambda c: s <= c < e, f'created_between({start}, {end})')
+
+
+__all__ = [
+    'Pred', 'ANY',
+    'heading_is', 'heading_contains', 'heading_matches',
+    'has_tag', 'has_self_tag', 'has_property',
+    'level_is', 'level_between',
+    'has_created', 'created_before', 'created_after', 'created_between',
+]
@@ -0,0 +1,201 @@
+# in memory full text index over headings and bodies, ranked with BM25
+# unlike contains() in xpath_all, nothing is serialized or scanned per query: only the postings of the query terms are looked at
+# heading matches count more than body ones (BM25F style, terms in the heading are weighted by heading_weight)
+# usage:
+#   org.search('python async*')      # index is built on first use and kept up to date by update_from_string/reload
+#   SearchIndex.from_corpus(corpus)  # or explicitly, for many files
+from bisect import bisect_left
+from collections import Counter
+import heapq
+import math
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import Org, Changes
+
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(s: str) -> List[str]:
+    return _TOKEN.findall(s.lower())
+
+
+class SearchResult(NamedTuple):
+    org: 'Org'
+    score: float
+
+
+class SearchIndex:
+    def __init__(self, heading_weight: float=2.0, k1: float=1.2, b: float=0.75) -> None:
+        self.heading_weight = heading_weight
+        self.k1 = k1
+        self.b = b
+        self._ids: Dict['Org', int] = {}
+        self._docs: Dict[int, Tuple['Org', float, List[str]]] = {} # id -> (node, weighted length, distinct terms)
+        self._postings: Dict[str, Dict[int, float]] = {} # term -> id -> weighted term frequency
+        self._total_len = 0.0
+        self._next_id = 0
+        self._vocab: Optional[List[str]] = None # sorted, for prefix queries; rebuilt lazily after updates
+        # term -> id -> BM25 score, and the same sorted best first; depend on the average length, so dropped on any update
+        self._scores: Dict[str, Dict[int, float]] = {}
+        self._ranked: Dict[str, List[Tuple[float, int]]] = {}
+
+    @classmethod
+    def from_org(cls, org: 'Org', **kwargs) -> 'SearchIndex':
+        res = cls(**kwargs)
+        res.add(org)
+        return res
+
+    @classmethod
+    def from_corpus(cls, corpus, **kwargs) -> 'SearchIndex':
+        res = cls(**kwargs)
+        for org in corpus.files.values():
+            res.add(org)
+        return res
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, o: 'Org') -> bool:
+        return o in self._ids
+
+    # the node and everything under it, same nodes as Org.iterate
+    def add(self, org: 'Org') -> None:
+        for o in org.iterate():
+            self.add_node(o)
+
+    def remove(self, org: 'Org') -> None:
+        for o in org.iterate():
+            self.remove_node(o)
+
+    def add_node(self, o: 'Org') -> None:
+        if o in self._ids:
+            self.remove_node(o)
+        tf: Dict[str, float] = Counter(tokenize(o.body)) # type: ignore
+        for t in tokenize(o.heading):
+            tf[t] = tf.get(t, 0) + self.heading_weight
+        doc = self._next_id
+        self._next_id += 1
+        self._ids[o] = doc
+        self._invalidate()
+        length = sum(tf.values())
+        self._docs[doc] = (o, length, list(tf.keys()))
+        self._total_len += length
+        for t, f in tf.items():
+            postings = self._postings.get(t)
+            if postings is None:
+                postings = self._postings[t] = {}
+                self._vocab = None
+            postings[doc] = f
+
+    def remove_node(self, o: 'Org') -> None:
+        doc = self._ids.pop(o, None)
+        if doc is None:
+            return
+        self._invalidate()
+        (_, length, terms) = self._docs.pop(doc)
+        self._total_len -= length
+        for t in terms:
+            postings = self._postings[t]
+            del postings[doc]
+            if len(postings) == 0:
+                del self._postings[t]
+                self._vocab = None
+
+    def _invalidate(self) -> None:
+        if len(self._scores) > 0 or len(self._ranked) > 0:
+            self._scores = {}
+            self._ranked = {}
+
+    # same as remove + add, e.g. after changing the node in place
+    def update_node(self, o: 'Org') -> None:
+        self.add_node(o)
+
+    # applies the result of Org.update_from_string/reload
+    def update(self, changes: 'Changes') -> None:
+        for o in changes.removed:
+            self.remove(o)
+        for old, new in changes.modified:
+            self.remove(old)
+            self.add(new)
+        for o in changes.added:
+            self.add(o)
+
+    def _expand(self, prefix: str) -> List[str]:
+        if self._vocab is None:
+            self._vocab = sorted(self._postings.keys())
+        vocab = self._vocab
+        res = []
+        for i in range(bisect_left(vocab, prefix), len(vocab)):
+            t = vocab[i]
+            if not t.startswith(prefix):
+                break
+            res.append(t)
+        return res
+
+    def _term_scores(self, t: str) -> Dict[int, float]:
+        res = self._scores.get(t)
+        if res is None:
+            n = len(self._docs)
+            avgdl = self._total_len / n
+            k1, b = self.k1, self.b
+            docs = self._docs
+            postings = self._postings[t]
+            df = len(postings)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            res = {
+                doc: idf * f * (k1 + 1) / (f + k1 * (1 - b + b * docs[doc][1] / avgdl))
+                for doc, f in postings.items()
+            }
+            self._scores[t] = res
+        return res
+
+    def _term_ranked(self, t: str) -> List[Tuple[float, int]]:
+        res = self._ranked.get(t)
+        if res is None:
+            res = sorted((-score, doc) for doc, score in self._term_scores(t).items())
+            self._ranked[t] = res
+        return res
+
+    # terms are OR-ed and scored with BM25; 'term*' matches anything starting with term
+    # prefix=True treats every term as a prefix (e.g. for search as you type)
+    # limit=None returns all matches, best first
+    # per term scores are cached until the next update, so repeated queries only merge them
+    def search(self, query: str, limit: Optional[int]=10, prefix=False) -> List[SearchResult]:
+        if len(self._docs) == 0:
+            return []
+        terms: List[str] = []
+        for word in query.split():
+            is_prefix = prefix or word.endswith('*')
+            for token in tokenize(word):
+                if is_prefix:
+                    terms.extend(self._expand(token))
+                elif token in self._postings:
+                    terms.append(token)
+
+        docs = self._docs
+        if len(terms) == 1:
+            ranked = self._term_ranked(terms[0])
+            top = ranked if limit is None else ranked[:limit]
+            return [SearchResult(docs[doc][0], -neg) for neg, doc in top]
+
+        per_term = sorted((self._term_scores(t) for t in terms), key=len, reverse=True)
+        if len(per_term) == 0:
+            return []
+        scores = dict(per_term[0]) # the largest one is copied rather than merged
+        for ts in per_term[1:]:
+            for doc, sc in ts.items():
+                scores[doc] = scores.get(doc, 0.0) + sc
+        if limit is None:
+            best = sorted(scores.items(), key=lambda ds: (-ds[1], ds[0]))
+        else:
+            best = heapq.nsmallest(limit, scores.items(), key=lambda ds: (-ds[1], ds[0]))
+        return [SearchResult(docs[doc][0], score) for doc, score in best]
+
+    def __repr__(self):
+        return f'SearchIndex{{nodes={len(self._docs)}, terms={len(self._postings)}}}'
+
+
+__all__ = ['SearchIndex', 'SearchResult', 'tokenize']
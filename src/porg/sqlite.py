@@ -0,0 +1,293 @@
+# sqlite backend: every node of every indexed file is stored in a table, with FTS5 over headings and bodies,
+# so a large knowledge base can be queried without keeping (or even parsing) the trees in memory
+# results are NodeRef, which have the usual Org fields; the actual Org subtree is loaded from the source file on demand
+# usage:
+#   db = OrgDB('notes.sqlite')
+#   db.index_dir('~/notes') # only reindexes files which changed since the last time
+#   for n in db.search('python NEAR(asyncio)'): print(n.path, n.linenumber, n.heading)
+from datetime import date, datetime
+import json
+from pathlib import Path
+import sqlite3
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Union
+
+from . import Org, Span, get_logger
+from .query import _as_datetime
+
+
+PathIsh = Union[Path, str]
+Dateish = Union[datetime, date]
+
+# bump when the schema changes, the database is rebuilt then
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id          INTEGER PRIMARY KEY,
+    path        TEXT UNIQUE NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    preamble    INTEGER NOT NULL -- byte length of everything before the first heading
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    id          INTEGER PRIMARY KEY,
+    file_id     INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    pos         INTEGER NOT NULL, -- in Org.iterate order
+    parent_id   INTEGER,          -- NULL for top level entries
+    heading     TEXT NOT NULL,
+    level       INTEGER NOT NULL,
+    tags        TEXT NOT NULL,    -- json lists
+    self_tags   TEXT NOT NULL,
+    properties  TEXT NOT NULL,    -- json object
+    created     TEXT,             -- isoformat, date or datetime
+    created_dt  TEXT,             -- same, but always a datetime, for comparisons
+    start_line  INTEGER NOT NULL, -- subtree span, see porg.Span
+    end_line    INTEGER NOT NULL,
+    start_byte  INTEGER NOT NULL,
+    end_byte    INTEGER NOT NULL,
+    body        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS nodes_file    ON nodes(file_id, pos);
+CREATE INDEX IF NOT EXISTS nodes_parent  ON nodes(parent_id);
+CREATE INDEX IF NOT EXISTS nodes_created ON nodes(created_dt);
+CREATE TABLE IF NOT EXISTS node_tags (
+    node_id     INTEGER NOT NULL REFERENCES nodes(id) ON DELETE CASCADE,
+    tag         TEXT NOT NULL,
+    own         INTEGER NOT NULL -- 0 if only inherited
+);
+CREATE INDEX IF NOT EXISTS node_tags_tag ON node_tags(tag, node_id);
+CREATE INDEX IF NOT EXISTS node_tags_node ON node_tags(node_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS nodes_fts USING fts5(heading, body, content='nodes', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS nodes_ai AFTER INSERT ON nodes BEGIN
+    INSERT INTO nodes_fts(rowid, heading, body) VALUES (new.id, new.heading, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS nodes_ad AFTER DELETE ON nodes BEGIN
+    INSERT INTO nodes_fts(nodes_fts, rowid, heading, body) VALUES ('delete', old.id, old.heading, old.body);
+END;
+"""
+
+_NODE_COLUMNS = 'n.id, f.path, n.pos, n.parent_id, n.heading, n.level, n.tags, n.self_tags, n.properties, n.created, n.start_line, n.end_line, n.start_byte, n.end_byte'
+_NODE_FROM = 'nodes n JOIN files f ON f.id = n.file_id'
+
+
+# python 3.6 has no fromisoformat, and its %z doesn't accept the colon in the offset
+def _strptime_isoformat(s: str) -> datetime:
+    fmt = '%Y-%m-%dT%H:%M:%S'
+    if '.' in s[19:]:
+        fmt += '.%f'
+    if len(s) > 19 and s[-6] in '+-':
+        s = s[:-3] + s[-2:]
+        fmt += '%z'
+    return datetime.strptime(s, fmt)
+
+
+# inverse of isoformat(), which is what's stored
+def _parse_created(s: Optional[str]) -> Optional[Dateish]:
+    if s is None:
+        return None
+    if len(s) == 10:
+        return date(*map(int, s.split('-')))
+    if hasattr(datetime, 'fromisoformat'):
+        return datetime.fromisoformat(s)
+    return _strptime_isoformat(s)
+
+
+# result of OrgDB queries: the indexed fields are available right away, the body and the tree are fetched on demand
+class NodeRef:
+    def __init__(self, db: 'OrgDB', row: Sequence[Any]) -> None:
+        self._db = db
+        (self.id, path, self._pos, self._parent_id, self.heading, self.level, tags, self_tags, properties, created, *span) = row
+        self.path = Path(path)
+        self.tags = set(json.loads(tags))
+        self.self_tags = set(json.loads(self_tags))
+        self.properties = json.loads(properties)
+        self.created = _parse_created(created)
+        self.subtree_span = Span(*span)
+        self._org: Optional[Org] = None
+
+    # 1-based, same as Org.linenumber
+    @property
+    def linenumber(self) -> int:
+        return self.subtree_span.start_line + 1
+
+    @property
+    def body(self) -> str:
+        [(body,)] = self._db._conn.execute('SELECT body FROM nodes WHERE id = ?', (self.id,))
+        return body
+
+    @property
+    def parent(self) -> Optional['NodeRef']:
+        if self._parent_id is None:
+            return None
+        [res] = self._db._select('n.id = ?', (self._parent_id,))
+        return res
+
+    @property
+    def children(self) -> List['NodeRef']:
+        return self._db._select('n.parent_id = ? ORDER BY n.pos', (self.id,))
+
+    # the subtree, parsed from the source file on first access. Only the file settings and the subtree itself are read,
+    # so tags inherited from the parents are missing on the returned Org (they are in NodeRef.tags though)
+    @property
+    def org(self) -> Org:
+        if self._org is None:
+            self._org = self._db._load_subtree(self)
+        return self._org
+
+    def __repr__(self):
+        return 'NodeRef{{{}}}'.format(self.heading)
+
+
+class OrgDB:
+    def __init__(self, db_path: PathIsh) -> None:
+        self.db_path = db_path
+        self._conn = sqlite3.connect(str(db_path))
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        (version,) = next(self._conn.execute('PRAGMA user_version'))
+        if version != SCHEMA_VERSION:
+            self._reset()
+        self._conn.executescript(_SCHEMA)
+
+    def _reset(self) -> None:
+        with self._conn:
+            for (name, kind) in list(self._conn.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'trigger') AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'nodes_fts_%'")):
+                self._conn.execute(f'DROP {kind.upper()} IF EXISTS {name}')
+            self._conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> 'OrgDB':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _file_row(self, path: Path) -> Optional[Tuple[int, int, int]]:
+        rows = list(self._conn.execute('SELECT id, size, mtime_ns FROM files WHERE path = ?', (str(path),)))
+        return rows[0] if len(rows) > 0 else None
+
+    # returns False if the file didn't change since it was indexed
+    def index_file(self, fname: PathIsh, force=False) -> bool:
+        path = Path(fname).resolve()
+        st = path.stat()
+        existing = self._file_row(path)
+        if not force and existing is not None and existing[1:] == (st.st_size, st.st_mtime_ns):
+            return False
+
+        org = Org.from_file(path)
+        nodes = list(org.iterate())
+        from .export import iter_records
+        records = iter_records(org, ('heading', 'level', 'tags', 'self_tags', 'properties', 'created', 'body'))
+
+        with self._conn:
+            if existing is not None:
+                self._conn.execute('DELETE FROM files WHERE id = ?', (existing[0],)) # cascades to nodes/node_tags
+            cur = self._conn.execute(
+                'INSERT INTO files(path, size, mtime_ns, preamble) VALUES (?, ?, ?, ?)',
+                (str(path), st.st_size, st.st_mtime_ns, org.span.end),
+            )
+            file_id = cur.lastrowid
+            # ids are assigned here, so parent ids are known without a roundtrip per node
+            [(base,)] = self._conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM nodes')
+            ids = {id(o): base + pos for pos, o in enumerate(nodes)}
+            rows = []
+            tag_rows = []
+            for pos, (o, rec) in enumerate(zip(nodes, records)):
+                nid = base + pos
+                c = rec['created']
+                span = o.subtree_span
+                rows.append((
+                    nid, file_id, pos, ids.get(id(o.parent)),
+                    rec['heading'], rec['level'],
+                    json.dumps(rec['tags']), json.dumps(rec['self_tags']), json.dumps(rec['properties'], ensure_ascii=False),
+                    None if c is None else c.isoformat(), None if c is None else _as_datetime(c).isoformat(),
+                    span.start_line, span.end_line, span.start, span.end,
+                    rec['body'],
+                ))
+                own = set(rec['self_tags'])
+                tag_rows.extend((nid, t, int(t in own)) for t in rec['tags'])
+            self._conn.executemany('INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._conn.executemany('INSERT INTO node_tags VALUES (?, ?, ?)', tag_rows)
+        return True
+
+    def remove_file(self, fname: PathIsh) -> None:
+        with self._conn:
+            self._conn.execute('DELETE FROM files WHERE path = ?', (str(Path(fname).resolve()),))
+
+    # returns (updated, removed) paths; files which failed to parse are logged and skipped
+    def index_dir(self, root: PathIsh, pattern: str='**/*.org') -> Tuple[List[Path], List[Path]]:
+        rootp = Path(root).expanduser().resolve()
+        current = {p.resolve() for p in rootp.glob(pattern) if p.is_file()}
+        updated: List[Path] = []
+        for p in sorted(current):
+            try:
+                if self.index_file(p):
+                    updated.append(p)
+            except Exception as e:
+                get_logger().warning('failed to index %s: %s', p, e)
+        removed: List[Path] = []
+        for (path,) in list(self._conn.execute('SELECT path FROM files')):
+            p = Path(path)
+            if rootp in p.parents and p not in current:
+                self.remove_file(p)
+                removed.append(p)
+        return (updated, removed)
+
+    @property
+    def files(self) -> List[Path]:
+        return [Path(p) for (p,) in self._conn.execute('SELECT path FROM files ORDER BY path')]
+
+    def __len__(self) -> int:
+        [(n,)] = self._conn.execute('SELECT COUNT(*) FROM nodes')
+        return n
+
+    def _select(self, where: str, params: Iterable[Any]=()) -> List[NodeRef]:
+        sql = f'SELECT {_NODE_COLUMNS} FROM {_NODE_FROM} WHERE {where}'
+        return [NodeRef(self, row) for row in self._conn.execute(sql, tuple(params))]
+
+    # escape hatch: arbitrary condition on the nodes table (aliased as n) and files (f)
+    def query(self, where: str, params: Iterable[Any]=()) -> List[NodeRef]:
+        return self._select(where + ' ORDER BY f.path, n.pos', params)
+
+    # query is in fts5 syntax (e.g. 'heading: python', 'sql*', 'a NEAR(b)'), best matches first
+    def search(self, query: str, limit: Optional[int]=None) -> List[NodeRef]:
+        sql = f'SELECT {_NODE_COLUMNS} FROM nodes_fts JOIN nodes n ON n.id = nodes_fts.rowid JOIN files f ON f.id = n.file_id WHERE nodes_fts MATCH ? ORDER BY bm25(nodes_fts)'
+        params: Tuple[Any, ...] = (query,)
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params += (limit,)
+        try:
+            return [NodeRef(self, row) for row in self._conn.execute(sql, params)]
+        except sqlite3.OperationalError as e: # syntax errors in the query
+            raise RuntimeError(f'Bad search query {query!r}: {e}') from e
+
+    def with_tag(self, tag: str, with_inherited=True) -> List[NodeRef]:
+        own = '' if with_inherited else ' AND own = 1'
+        return self.query(f'n.id IN (SELECT node_id FROM node_tags WHERE tag = ?{own})', (tag,))
+
+    # half-open, same as DateIndex.between
+    def created_between(self, start: Dateish, end: Dateish) -> List[NodeRef]:
+        return self.query('n.created_dt >= ? AND n.created_dt < ?', (_as_datetime(start).isoformat(), _as_datetime(end).isoformat()))
+
+    def _load_subtree(self, ref: NodeRef) -> Org:
+        [(size, mtime_ns, preamble)] = self._conn.execute(
+            'SELECT size, mtime_ns, preamble FROM files f JOIN nodes n ON n.file_id = f.id WHERE n.id = ?', (ref.id,),
+        )
+        st = ref.path.stat()
+        if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+            raise RuntimeError(f'{ref.path} changed since it was indexed, reindex it first')
+        span = ref.subtree_span
+        with ref.path.open('rb') as fo:
+            head = fo.read(preamble)
+            fo.seek(span.start)
+            sub = fo.read(span.end - span.start)
+        text = str(head + sub, 'utf8')
+        children = Org.from_string(text).children
+        if len(children) > 0 and children[0].heading == ref.heading:
+            return children[0]
+        # byte offsets don't match up (e.g. \r\n line endings), so take the slow path
+        return list(Org.from_file(ref.path).iterate())[ref._pos]
+
+
+__all__ = ['OrgDB', 'NodeRef', 'SCHEMA_VERSION']
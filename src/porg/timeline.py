@@ -0,0 +1,100 @@
+# all timestamps of a tree as flat numpy arrays, so histograms/range filters etc. don't have to loop over nodes in python
+# one row per timestamp: time, end (only for clock entries), kind, index of the node (into Timeline.nodes) and its level
+# usage:
+#   tl = org.timeline().of_kind('created')
+#   weeks = np.unique(tl.time.astype('datetime64[W]'), return_counts=True)
+# requires numpy (pip install porg[numpy])
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Tuple, Union, TYPE_CHECKING
+
+import numpy as np # type: ignore
+
+if TYPE_CHECKING:
+    from . import Org
+
+
+KINDS = ('created', 'scheduled', 'deadline', 'clock')
+
+# org timestamps don't have seconds
+UNIT = 'datetime64[m]'
+
+Dateish = Union[datetime, date]
+
+
+class Timeline:
+    def __init__(self, nodes: List['Org'], time, end, kind, node, level) -> None:
+        self.nodes = nodes # every node Org.iterate yields, not just the ones with timestamps
+        self.time  = time  # datetime64[m]
+        self.end   = end   # datetime64[m], NaT unless it's a finished clock entry
+        self.kind  = kind  # uint8, index into KINDS
+        self.node  = node  # int64, index into nodes
+        self.level = level # int64
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def _take(self, idx) -> 'Timeline':
+        return Timeline(self.nodes, self.time[idx], self.end[idx], self.kind[idx], self.node[idx], self.level[idx])
+
+    def of_kind(self, *kinds: str) -> 'Timeline':
+        codes = [KINDS.index(k) for k in kinds]
+        return self._take(np.isin(self.kind, codes))
+
+    # half-open, same as DateIndex.between
+    def between(self, start: Dateish, end: Dateish) -> 'Timeline':
+        s, e = np.datetime64(start, 'm'), np.datetime64(end, 'm')
+        return self._take((self.time >= s) & (self.time < e))
+
+    def sorted(self) -> 'Timeline':
+        return self._take(np.argsort(self.time, kind='stable'))
+
+    # NaT for anything but finished clock entries
+    @property
+    def durations(self):
+        return self.end - self.time
+
+    def org(self, i: int) -> 'Org':
+        return self.nodes[self.node[i]]
+
+    def kind_of(self, i: int) -> str:
+        return KINDS[self.kind[i]]
+
+    def __repr__(self):
+        return f'Timeline{{entries={len(self)}, nodes={len(self.nodes)}}}'
+
+
+def timeline(org: 'Org', kinds: Iterable[str]=KINDS) -> Timeline:
+    kinds = tuple(kinds)
+    for k in kinds:
+        if k not in KINDS:
+            raise RuntimeError(f'Unknown timestamp kind {k!r}, expected one of {KINDS}')
+    want = [k in kinds for k in KINDS]
+    (w_created, w_scheduled, w_deadline, w_clock) = want
+
+    nodes = list(org.iterate())
+    rows: List[Tuple[Dateish, Optional[Dateish], int, int, int]] = []
+    for i, o in enumerate(nodes):
+        node = o.node
+        level = node.level
+        if w_created:
+            c = o.created
+            if c is not None:
+                rows.append((c, None, 0, i, level))
+        if w_scheduled and node.scheduled:
+            rows.append((node.scheduled.start, None, 1, i, level))
+        if w_deadline and node.deadline:
+            rows.append((node.deadline.start, None, 2, i, level))
+        if w_clock:
+            for cl in node.clock:
+                rows.append((cl.start, cl.end, 3, i, level))
+
+    n = len(rows)
+    time  = np.array([r[0] for r in rows], dtype=UNIT).reshape(n)
+    end   = np.array([np.datetime64('NaT') if r[1] is None else r[1] for r in rows], dtype=UNIT).reshape(n)
+    kind  = np.fromiter((r[2] for r in rows), dtype=np.uint8, count=n)
+    node  = np.fromiter((r[3] for r in rows), dtype=np.int64, count=n)
+    level = np.fromiter((r[4] for r in rows), dtype=np.int64, count=n)
+    return Timeline(nodes, time, end, kind, node, level)
+
+
+__all__ = ['Timeline', 'timeline', 'KINDS']
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# benchmarks, not collected by pytest; run as python3 tests/bench_porg.py [--nodes N] [--json results.json]
+# results are printed as json, so they can be compared across releases
+import argparse
+from datetime import datetime, timedelta
+import json
+from pathlib import Path
+import platform
+import random
+import shutil
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from porg import Org, __version__
+
+
+DATA = Path(__file__).parent / 'data'
+
+_WORDS = 'alpha beta gamma delta notes meeting idea project reading todo review draft python org emacs'.split()
+_WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def _ts(d: datetime) -> str:
+    return '[{} {} {}]'.format(d.strftime('%Y-%m-%d'), _WEEKDAYS[d.weekday()], d.strftime('%H:%M'))
+
+
+# deterministic for the same arguments
+# nodes: total number of headings; depth: max heading level
+# tags: size of the tag vocabulary; properties: per node
+# tables/timestamps: fraction of nodes with a table in the body/a created timestamp
+def generate_org(
+        nodes: int=1000,
+        depth: int=4,
+        tags: int=20,
+        properties: int=2,
+        tables: float=0.1,
+        timestamps: float=0.5,
+        seed: int=0,
+) -> str:
+    rnd = random.Random(seed)
+    vocab = [f'tag{i}' for i in range(tags)]
+    start = datetime(2018, 1, 1)
+    res: List[str] = [
+        '#+TITLE: synthetic',
+        '#+FILETAGS: :bench:',
+        '',
+    ]
+    level = 0
+    for _ in range(nodes):
+        level = rnd.randint(1, min(level + 1, depth))
+        heading = ' '.join(rnd.choice(_WORDS) for _ in range(rnd.randint(1, 5)))
+        created: Optional[datetime] = None
+        if rnd.random() < timestamps:
+            created = start + timedelta(minutes=rnd.randrange(60 * 24 * 365 * 3))
+            if rnd.random() < 0.5:
+                heading = _ts(created) + ' ' + heading
+                created = None
+        ntags = rnd.randint(0, min(3, tags))
+        tstr = (' :' + ':'.join(rnd.sample(vocab, ntags)) + ':') if ntags > 0 else ''
+        res.append('*' * level + ' ' + heading + tstr)
+
+        props = [(f'PROP{i}', rnd.choice(_WORDS)) for i in range(properties)]
+        if created is not None:
+            props.append(('CREATED', _ts(created)))
+        if len(props) > 0:
+            res.append(':PROPERTIES:')
+            res.extend(f':{k}: {v}' for k, v in props)
+            res.append(':END:')
+
+        for _ in range(rnd.randint(0, 3)):
+            res.append(' '.join(rnd.choice(_WORDS) for _ in range(rnd.randint(3, 12))))
+        if rnd.random() < tables:
+            res.append('| date | value | comment |')
+            res.append('|------+-------+---------|')
+            for _ in range(rnd.randint(1, 10)):
+                d = start + timedelta(days=rnd.randrange(1000))
+                res.append(f'| {_ts(d)} | {rnd.randint(0, 100)} | {rnd.choice(_WORDS)} |')
+    return '\n'.join(res) + '\n'
+
+
+# best of several runs; setup isn't timed and is rerun for each run, so memoized state doesn't leak between runs
+def _best(f: Callable[[Any], object], setup: Callable[[], Any]=lambda: None, repeat: int=5) -> float:
+    res = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        f(arg)
+        res.append(time.perf_counter() - start)
+    return min(res)
+
+
+def bench_api(text: str, repeat: int, only: Optional[List[str]]=None) -> Dict[str, float]:
+    def fresh() -> Org:
+        return Org.from_string(text)
+
+    def fresh_nodes() -> List[Org]:
+        return list(Org.from_string(text).iterate())
+
+    def children(org: Org) -> None:
+        for o in org.iterate():
+            o.children
+
+    def created(nodes: List[Org]) -> None:
+        for o in nodes:
+            o.created
+
+    def contents(nodes: List[Org]) -> None:
+        for o in nodes:
+            o.contents
+
+    benchmarks = {
+        'from_string': (lambda _: Org.from_string(text), lambda: None),
+        'iterate'    : (lambda org: list(org.iterate()), fresh),
+        'children'   : (children                       , fresh),
+        'xpath_all'  : (lambda org: org.xpath_all('//org[contains(heading, "project")]'), fresh),
+        'with_tag'   : (lambda org: org.with_tag('tag1'), fresh),
+        'created'    : (created                        , fresh_nodes),
+        'contents'   : (contents                       , fresh_nodes),
+        'get_raw'    : (lambda org: org.get_raw(recursive=True), fresh),
+    }
+    return {name: _best(f, setup, repeat=repeat) for name, (f, setup) in benchmarks.items() if only is None or name in only}
+
+
+def bench_parse_cache(copies: int=30, repeat: int=5) -> Dict[str, float]:
+    tdir = Path(tempfile.mkdtemp())
+    try:
+        f = tdir / 'big.org'
+        f.write_text((DATA / 'org-brain-readme.org').read_text() * copies)
+        cdir = tdir / 'cache'
+
+        Org.from_file(f, cache_dir=cdir) # populate
+
+        return {
+            'from_file'          : _best(lambda _: Org.from_file(f), repeat=repeat),
+            'from_file_cache_hit': _best(lambda _: Org.from_file(f, cache_dir=cdir), repeat=repeat),
+        }
+    finally:
+        shutil.rmtree(tdir)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument('--nodes', type=int, default=2000)
+    p.add_argument('--depth', type=int, default=4)
+    p.add_argument('--seed' , type=int, default=0)
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--only', action='append', help='run only these benchmarks (can be repeated), parse_cache for from_file ones')
+    p.add_argument('--json', type=Path, help='also write results to this file')
+    args = p.parse_args()
+
+    text = generate_org(nodes=args.nodes, depth=args.depth, seed=args.seed)
+    timings = bench_api(text, repeat=args.repeat, only=args.only)
+    if args.only is None or 'parse_cache' in args.only:
+        timings.update(bench_parse_cache(repeat=args.repeat))
+
+    res = {
+        'porg'    : __version__,
+        'python'  : platform.python_version(),
+        'platform': platform.platform(),
+        'params'  : {'nodes': args.nodes, 'depth': args.depth, 'seed': args.seed, 'repeat': args.repeat, 'bytes': len(text.encode('utf8'))},
+        # best of repeat runs, in seconds
+        'timings' : timings,
+    }
+    out = json.dumps(res, indent=2)
+    print(out)
+    if args.json is not None:
+        args.json.write_text(out + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,29 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-"""
-    Dummy conftest.py for porg.
+from pathlib import Path
 
-    If you don't know what this is for, just leave it empty.
-    Read more about conftest.py under:
-    https://pytest.org/latest/plugins.html
-"""
+import pytest
 
-# import pytest
+
+# small notes directory for the tests that work with many files (corpus, cli, sqlite)
+# 4 nodes: 'meeting about python' and its child 'notes' in a.org, 'shopping' and 'reading' in sub/b.org
+@pytest.fixture
+def notes(tmp_path: Path) -> Path:
+    d = tmp_path / 'notes'
+    (d / 'sub').mkdir(parents=True)
+    (d / 'a.org').write_text("""#+FILETAGS: :work:
+#+TODO: TODO WAIT | DONE
+* [2019-01-01 Tue 10:00] meeting about python
+notes from the meeting
+** WAIT notes :todo:
+asyncio questions
+""")
+    (d / 'sub' / 'b.org').write_text("""* shopping :todo:
+:PROPERTIES:
+:CREATED: [2019-02-01 Fri 12:00]
+:END:
+milk, pythons
+* reading
+""")
+    (d / 'ignored.txt').write_text('* not org')
+    return d
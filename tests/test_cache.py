@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import os
+from pathlib import Path
+
+from porg import Org
+from porg.cache import ParseCache, get_cache
+
+
+def test_parse_cache(tmp_path: Path):
+    cdir = tmp_path / 'cache'
+    f = tmp_path / 'notes.org'
+    f.write_text("""
+* hello :tag:
+** world
+""")
+    stats = get_cache(cdir).stats
+
+    org = Org.from_file(f, cache_dir=cdir)
+    assert (stats.hits, stats.misses) == (0, 1)
+    assert [o.heading for o in org.iterate()] == ['hello', 'world']
+
+    org = Org.from_file(f, cache_dir=cdir)
+    assert (stats.hits, stats.misses) == (1, 1)
+    assert [o.heading for o in org.with_tag('tag')] == ['hello', 'world']
+
+    # mtime changed, but the contents didn't
+    st = f.stat()
+    os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    Org.from_file(f, cache_dir=cdir)
+    assert (stats.hits, stats.misses) == (2, 1)
+
+    f.write_text("""
+* changed
+""")
+    org = Org.from_file(f, cache_dir=cdir)
+    assert (stats.hits, stats.misses) == (2, 2)
+    assert [o.heading for o in org.iterate()] == ['changed']
+
+
+def test_parse_cache_version(tmp_path: Path, monkeypatch):
+    import porg.cache as C
+    f = tmp_path / 'notes.org'
+    f.write_text('* hello')
+
+    cache = ParseCache(tmp_path / 'cache')
+    cache.load(f)
+    cache.load(f)
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+    monkeypatch.setattr(C, 'FORMAT_VERSION', C.FORMAT_VERSION + 1)
+    C._versions.cache_clear()
+    cache.load(f)
+    assert (cache.stats.hits, cache.stats.misses) == (1, 2)
+    C._versions.cache_clear()
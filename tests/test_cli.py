@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+import json
+import os
+from pathlib import Path
+
+from porg.cli import main
+
+
+def _run(capsys, *args) -> str:
+    assert main(list(args)) == 0
+    return capsys.readouterr().out
+
+
+def test_index(tmp_path: Path, notes: Path, capsys):
+    idx = ['--index-dir', str(tmp_path / 'index')]
+
+    assert _run(capsys, *idx, 'index', str(notes)) == '2 files, 4 nodes (2 updated, 0 removed)\n'
+    assert _run(capsys, *idx, 'index', str(notes)) == '2 files, 4 nodes (0 updated, 0 removed)\n'
+
+    b = notes / 'sub' / 'b.org'
+    b.write_text(b.read_text() + '* new :todo:\n')
+    st = b.stat()
+    os.utime(b, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert _run(capsys, *idx, 'index', str(notes)) == '2 files, 5 nodes (1 updated, 0 removed)\n'
+
+    (notes / 'a.org').unlink()
+    assert _run(capsys, *idx, 'index', str(notes)) == '1 files, 3 nodes (0 updated, 1 removed)\n'
+
+
+def test_query(tmp_path: Path, notes: Path, capsys):
+    idx = ['--index-dir', str(tmp_path / 'index')]
+
+    out = _run(capsys, *idx, 'query', str(notes), '--tag', 'todo')
+    assert out.splitlines() == ['a.org:5:notes', os.path.join('sub', 'b.org') + ':1:shopping']
+
+    out = _run(capsys, *idx, 'query', str(notes), '--tag', 'todo', '--tag', 'work')
+    assert out.splitlines() == ['a.org:5:notes']
+
+    [hit] = _run(capsys, *idx, 'query', str(notes), '--after', '2018-12-31', '--before', '2019-01-15', '--json').splitlines()
+    assert json.loads(hit)['heading'] == 'meeting about python'
+    assert json.loads(hit)['created'] == '2019-01-01T10:00:00'
+
+    assert main([*idx, 'query', str(notes), '--heading', 'nope']) == 1
+
+    out = _run(capsys, *idx, 'query', str(notes), '--xpath', '//org[heading="reading"]')
+    assert out.splitlines() == [os.path.join('sub', 'b.org') + ':6:reading']
+
+    # the files themselves
+    out = _run(capsys, *idx, 'query', str(notes), '--xpath', '/root')
+    assert out.splitlines() == ['a.org:0:', os.path.join('sub', 'b.org') + ':0:']
+    out = _run(capsys, *idx, 'query', str(notes), '--xpath', '//org[heading="shopping"]/../..', '--json')
+    assert [json.loads(l) for l in out.splitlines()] == [{'path': os.path.join('sub', 'b.org')}]
+
+
+def test_tags_export(tmp_path: Path, notes: Path, capsys):
+    idx = ['--index-dir', str(tmp_path / 'index')]
+
+    assert _run(capsys, *idx, 'tags', str(notes)).splitlines() == ['2\ttodo', '2\twork']
+    assert _run(capsys, *idx, 'tags', str(notes), '--own').splitlines() == ['2\ttodo']
+
+    lines = _run(capsys, *idx, 'export', str(notes), '--fields', 'heading,body').splitlines()
+    assert json.loads(lines[2]) == {'path': os.path.join('sub', 'b.org'), 'heading': 'shopping', 'body': 'milk, pythons'}
+
+    lines = _run(capsys, *idx, 'export', str(notes), '--format', 'csv', '--fields', 'heading,tags').splitlines()
+    assert lines[:2] == ['path,heading,tags', 'a.org,meeting about python,:work:']
+
+    assert main([*idx, 'export', str(notes), '--fields', 'nope']) == 2
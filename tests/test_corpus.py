@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+from pathlib import Path
+
+from porg.corpus import OrgCorpus
+from porg.query import heading_contains
+
+import pytest
+
+
+def _add_broken(notes: Path) -> Path:
+    f = notes / 'broken.org'
+    f.write_bytes(b'* \xff\xfe not utf8\n')
+    return f
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_corpus(notes: Path, workers: int):
+    broken = _add_broken(notes)
+    corpus = OrgCorpus(notes, workers=workers)
+
+    assert len(corpus) == 2
+    assert list(corpus.errors.keys()) == [broken]
+    assert isinstance(corpus.errors[broken], UnicodeDecodeError)
+
+    assert [(h.path.name, h.org.heading) for h in corpus.with_tag('todo')] == [
+        ('a.org', 'notes'),
+        ('b.org', 'shopping'),
+    ]
+    assert [h.org.heading for h in corpus.with_tag('work')] == ['meeting about python', 'notes']
+    assert [h.path.name for h in corpus.query(heading_contains('ing'))] == ['a.org', 'b.org', 'b.org']
+    assert len(list(corpus.iterate())) == 4
+    assert corpus[notes / 'a.org'].children[0].heading == 'meeting about python'
+
+
+def test_corpus_glob(notes: Path):
+    _add_broken(notes)
+    corpus = OrgCorpus(str(notes / 'sub' / '*.org'), workers=0)
+    assert [p.name for p in corpus.files] == ['b.org']
+    assert len(corpus.errors) == 0
+
+
+def test_corpus_cache(tmp_path: Path, notes: Path):
+    _add_broken(notes)
+    cdir = tmp_path / 'cache'
+    OrgCorpus(notes, workers=2, cache_dir=cdir)
+    assert len(list(cdir.glob('*.pickle'))) == 2
+
+    corpus = OrgCorpus(notes, workers=0, cache_dir=cdir)
+    assert [h.org.heading for h in corpus.with_tag('todo')] == ['notes', 'shopping']
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_corpus_aload(notes: Path, processes: bool):
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+
+    broken = _add_broken(notes)
+
+    async def run():
+        if processes:
+            with ProcessPoolExecutor(2) as pool:
+                return await OrgCorpus.aload(notes, concurrency=2, executor=pool)
+        return await OrgCorpus.aload(notes, concurrency=1)
+
+    corpus = asyncio.run(run())
+    assert len(corpus) == 2
+    assert list(corpus.errors.keys()) == [broken]
+    assert [h.org.heading for h in corpus.with_tag('todo')] == ['notes', 'shopping']
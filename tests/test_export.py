@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import csv
+from datetime import datetime
+from io import StringIO
+import json
+
+from porg import Org
+from porg.export import write_csv, write_ndjson
+
+import pytest
+
+
+ORG = """
+#+FILETAGS: :file:
+* [2019-01-01 Tue 10:00] first :a:
+body
+** child :b:
+:PROPERTIES:
+:CREATED: [2019-02-01 Fri 12:00]
+:END:
+* second
+"""
+
+
+def test_records():
+    org = Org.from_string(ORG)
+    recs = org.to_records()
+    assert len(recs) == 3
+    for rec, o in zip(recs, org.iterate()):
+        assert rec == {
+            'heading'   : o.heading,
+            'level'     : o.level,
+            'tags'      : sorted(o.tags),
+            'properties': o.properties,
+            'created'   : o.created,
+        }
+    assert recs[1]['tags'] == ['a', 'b', 'file']
+    assert recs[1]['created'] == datetime(2019, 2, 1, 12, 0)
+
+    first = org.children[0]
+    assert [r['heading'] for r in first.iter_records(['heading'])] == ['first', 'child']
+    assert first.to_records(['self_tags', 'linenumber', 'body'])[0] == {'self_tags': ['a'], 'linenumber': 3, 'body': 'body'}
+
+    cols = org.to_columns(['heading', 'level'])
+    assert cols == {'heading': ['first', 'child', 'second'], 'level': [1, 2, 1]}
+
+    with pytest.raises(RuntimeError, match='Unknown field'):
+        org.iter_records(['nope'])
+
+
+def test_writers():
+    org = Org.from_string(ORG)
+
+    fo = StringIO()
+    assert write_ndjson(org, fo) == 3
+    lines = fo.getvalue().splitlines()
+    assert json.loads(lines[0]) == {'heading': 'first', 'level': 1, 'tags': ['a', 'file'], 'properties': {}, 'created': '2019-01-01T10:00:00'}
+
+    fo = StringIO()
+    assert write_csv(org, fo, fields=['heading', 'tags', 'properties', 'created']) == 3
+    rows = list(csv.reader(StringIO(fo.getvalue())))
+    assert rows[0] == ['heading', 'tags', 'properties', 'created']
+    assert rows[2] == ['child', ':a:b:file:', '{"CREATED": "[2019-02-01 Fri 12:00]"}', '2019-02-01T12:00:00']
+    assert rows[3] == ['second', ':file:', '{}', '']
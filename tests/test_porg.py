@@ -401,3 +401,717 @@ def test_gh():
     assert h3.heading == 'H3'
     assert h4.heading == 'H4'
     assert h5.heading == 'H5'
+
+
+def test_query():
+    from porg.query import has_tag, has_self_tag, heading_contains, level_is, has_property, created_after, has_created
+    org = Org.from_string(ORG)
+
+    res = org.query(has_tag('kindle'))
+    assert [r.heading for r in res] == [
+        'Your Highlight on page 153 | Location 2342-2343 | Added on Thursday, October 19, 2017 1126 AM"',
+        'xxxx child node',
+    ]
+    assert len(org.query(has_self_tag('kindle'))) == 1
+    assert [r.heading for r in org.query(has_tag('kindle') & ~level_is(1))] == ['xxxx child node']
+
+    assert [r.heading for r in org.query(has_property('CREATED') | heading_contains('implicit'))] == [
+        'something',
+        'note-with-implicit-date',
+    ]
+    assert [r.heading for r in org.query(created_after(datetime(year=2018, month=10, day=20)))] == [
+        'something',
+        'also-priority',
+    ]
+    # doesn't include the node itself, same as '//org'
+    hello = org.children[0]
+    assert [r.heading for r in hello.query(has_created())] == ['something']
+    assert org.firstlevel() == org.children
+
+    # copies, the tree can't be modified through them
+    org.firstlevel().clear()
+    org.children.append(org)
+    assert len(org.children) == len(list(org.iterate(depth=1))) > 0
+    assert org.children[0] is org.children[0]
+
+
+def test_xml_cache():
+    org = Org.from_string(ORG, xml_cache=True)
+    assert org.xml_cache_stats.misses == 0
+
+    [res] = org.xpath_all("//org[contains(heading, 'implicit')]")
+    assert res.heading == 'note-with-implicit-date'
+    assert len(org.xpath_all('//org')) == 12
+    assert org.xpath('//root') is org
+    assert (org.xml_cache_stats.hits, org.xml_cache_stats.misses) == (2, 1)
+
+    # non-root nodes share the root's cache
+    froalala = org.children[5]
+    assert [c.heading for c in froalala.xpath_all('//org')] == ['Your Highlight on Location 392-393 | Added on Friday, April 13, 2018 8:51:38 AM']
+    assert (org.xml_cache_stats.hits, org.xml_cache_stats.misses) == (3, 1)
+
+    org.invalidate_xml_cache()
+    assert len(org.xpath_all('//org//table')) == 1
+    assert org.xml_cache_stats.misses == 2
+
+
+def test_xml_cache_detached(tmp_path: Path):
+    # nodes that aren't reachable from the root anymore
+    org = Org.from_string('* a\n** a1\n* b\n', xml_cache=True)
+    a = org.children[0]
+    org.update_from_string('* c\n')
+    assert [o.heading for o in a.xpath_all('//org')] == ['a1']
+    assert [o.heading for o in org.xpath_all('//org')] == ['c']
+
+    f = tmp_path / 'log.org'
+    f.write_text('#+FILETAGS: :log:\n* e1\n** child :x:\n* e2\n')
+    entries = list(Org.iter_file(f))
+    entries[0].enable_xml_cache()
+    assert [o.heading for o in entries[0].xpath_all('//org')] == ['child']
+    assert entries[1].xpath_all('//org') == []
+
+
+def test_xml_cache_values():
+    org = Org.from_string(ORG, xml_cache=True)
+    # non-org results are the python values, same as with Hiccup
+    [tags] = org.xpath_all("//org[heading='xpath_target']/tags")
+    assert tags == set()
+    [created] = org.xpath_all("//org[heading='something']/created")
+    assert created == datetime(2018, 10, 23, 20, 55)
+    [props] = org.xpath_all('//CREATED/..')
+    assert props == {'CREATED': '[2018-10-23 Tue 20:55]'}
+    assert org.xpath_all("//org[heading='etc']/level/text()") == ['1']
+
+
+# same answers whether the cache is on or off
+def test_xml_cache_same():
+    plain = Org.from_string(ORG)
+    cached = Org.from_string(ORG, xml_cache=True)
+
+    def value(org: Org, x):
+        # nodes and tables are compared by position, since the trees are different
+        if isinstance(x, Org):
+            return ('org', list(org.iterate()).index(x))
+        if isinstance(x, OrgTable):
+            return ('table', list(x.lines))
+        return x
+
+    for q in [
+            "//org[contains(heading, 'implicit')]",
+            "//org[heading='xpath_target']/tags",
+            "//org[heading='something']/created",
+            "//org[heading='something']/properties/CREATED/text()",
+            '//CREATED/..',
+            '//org//table',
+            "//org[tags/*[text()='kindle']]/heading/text()",
+            '/root/file_settings',
+            '//org[created]',
+            "//org[created='']",
+    ]:
+        assert [value(cached, x) for x in cached.xpath_all(q)] == [value(plain, x) for x in plain.xpath_all(q)], q
+
+
+def test_xpath_fields():
+    from porg import _xpath_fields
+    assert _xpath_fields("//org[contains(heading, 'x')]") == {'heading', 'children'}
+    assert _xpath_fields("//org[./tags/*[text()='x']]") == {'tags', 'children'}
+    assert 'contents' in _xpath_fields('//org//table')
+    # can't tell what these touch
+    assert 'created' in _xpath_fields("//org[contains(., 'x')]")
+    assert 'created' in _xpath_fields('//*[heading]')
+    assert _xpath_fields('//org[properties/CREATED]') == {'properties', 'children'}
+    # names that aren't fields could be anywhere
+    assert 'properties' in _xpath_fields('//org[.//CREATED]')
+    assert 'properties' in _xpath_fields('//CREATED/..')
+    assert 'properties' in _xpath_fields('//org[properties/CREATED]/CREATED')
+
+    org = Org.from_string(ORG, xml_cache=True)
+    assert [o.heading for o in org.xpath_all('//org[.//CREATED]')] == ['Hello', 'something']
+    assert [o.heading for o in org.xpath_all('//CREATED/../..')] == ['something']
+    assert len(org.xpath_all('/root/file_settings')) == 1
+
+
+@pytest.mark.parametrize('xml_cache', [False, True])
+def test_xpath_lazy(monkeypatch, xml_cache: bool):
+    import porg
+    def boom(*args, **kwargs):
+        raise AssertionError("shouldn't be called")
+    monkeypatch.setattr(porg, 'parse_org_date', boom)
+    monkeypatch.setattr(porg, '_parse_org_table', boom)
+
+    org = Org.from_string(ORG, xml_cache=xml_cache)
+    [res] = org.xpath_all("//org[contains(heading, 'target')]")
+    assert res.heading == 'xpath_target'
+
+
+
+def test_tag_index():
+    org = Org.from_string("""
+#+FILETAGS: :file:
+* a :x:
+** b :y:
+*** c :z:
+* d :y:
+** e
+""")
+    index = org.tag_index
+    assert [o.heading for o in index.with_tag('file')] == ['a', 'b', 'c', 'd', 'e']
+    assert [o.heading for o in index.with_tag('x')] == ['a', 'b', 'c']
+    assert [o.heading for o in index.with_tag('y', with_inherited=False)] == ['b', 'd']
+    assert index.with_tag('nope') == []
+
+    assert [o.heading for o in org.with_tags(all_of=['x', 'y'])] == ['b', 'c']
+    assert [o.heading for o in org.with_tags(any_of=['z', 'y'], none_of=['x'])] == ['d', 'e']
+    assert [o.heading for o in org.with_tags(any_of=['x', 'y'], with_inherited=False)] == ['a', 'b', 'd']
+    assert index.counts(with_inherited=False) == {'x': 1, 'y': 2, 'z': 1}
+
+    # subtree index
+    a = org.children[0]
+    assert [o.heading for o in a.with_tag('y')] == ['b', 'c']
+    assert a.tag_index.counts() == {'file': 2, 'x': 2, 'y': 2, 'z': 1}
+    assert a.tag_index.nodes == list(a.iterate())[1:]
+    # answered from the root index, nothing is kept on the other nodes
+    for o in org.iterate():
+        o.with_tag('y')
+    assert all(o._tag_index is None for o in org.iterate())
+
+    # nodes that aren't children of the root anymore
+    org.update_from_string('* d :y:\n')
+    assert [o.heading for o in a.with_tag('y')] == ['b', 'c']
+
+
+def test_date_index():
+    from datetime import date
+    org = Org.from_string("""
+* [2019-01-02] day
+* [2019-01-02 Wed 10:00] morning
+* no date
+** child
+   :PROPERTIES:
+   :CREATED: [2018-12-31 Mon 23:59]
+   :END:
+* [2019-01-02 Wed 00:00] midnight
+* [2019-03-01 Fri 12:00] later
+""")
+    index = org.date_index
+    assert len(index) == 5
+    hh = lambda nodes: [n.heading for n in nodes]
+    assert hh(index.nodes) == ['child', 'day', 'midnight', 'morning', 'later']
+
+    assert hh(index.between(date(2019, 1, 2), date(2019, 1, 3))) == ['day', 'midnight', 'morning']
+    assert hh(index.between(datetime(2019, 1, 2, 5, 0), datetime(2019, 3, 1, 12, 0))) == ['morning']
+    assert hh(index.before(date(2019, 1, 2))) == ['child']
+    assert hh(index.after(date(2019, 1, 2))) == ['morning', 'later']
+    assert hh(index.latest(2)) == ['later', 'morning']
+    assert index.latest(0) == []
+
+
+def test_identity():
+    org = Org.from_string(ORG)
+    hello = org.children[0]
+    assert hello is org.children[0]
+    [something] = hello.children
+    assert something._root is org
+    assert something.parent is hello
+    assert find(org, 'something') is something
+    assert org.with_tag('kindle')[0] is org.children[6]
+    assert not hasattr(something, '__dict__')
+
+
+def test_update():
+    text = """
+#+TODO: TODO WAIT | DONE
+intro
+* WAIT first :a:
+** child
+* second
+* third
+"""
+    org = Org.from_string(text)
+    first, second, third = org.children
+    child = first.children[0]
+    assert first.tag_index.with_tag('a') == [child]
+
+    changes = org.update_from_string(text.replace('* second', '* second\nmore text') + '* WAIT fourth\n')
+    assert changes.removed == []
+    assert [(o.heading, n.heading) for o, n in changes.modified] == [('second', 'second')]
+    assert [n.heading for n in changes.added] == ['fourth']
+    assert changes.added[0].node.todo == 'WAIT'
+
+    assert org.children[0] is first
+    assert org.children[0].children[0] is child
+    assert org.children[2] is third
+    assert org.children[1].body == 'more text'
+    assert [o.heading for o in org.iterate()] == ['first', 'child', 'second', 'third', 'fourth']
+    assert org._tree.version == 1
+
+    # nothing changed
+    assert not org.update_from_string(org.get_raw(recursive=True))
+    assert org._tree.version == 1
+
+    changes = org.update_from_string("""
+#+TODO: TODO WAIT | DONE
+other intro
+* WAIT first :a:
+** child
+""")
+    assert org.body == '\n#+TODO: TODO WAIT | DONE\nother intro'
+    assert [n.heading for n in changes.removed] == ['second', 'third', 'fourth']
+    assert org.children == [first]
+
+    # settings changed, so everything is reparsed
+    changes = org.update_from_string("""
+#+FILETAGS: :b:
+* WAIT first :a:
+""")
+    assert changes.removed == [first]
+    assert [n.heading for n in changes.added] == ['WAIT first']
+    assert org.with_tag('b') == org.children
+
+
+def test_update_deep_first():
+    # entries before the first top level heading are still children of the root
+    org = Org.from_string('intro\n** deep\n*** deeper\n* a\n')
+    deep, a = org.children
+    changes = org.update_from_string('intro\n** deep2\n*** deeper\n* a\n')
+    assert changes.removed == [] and changes.added == []
+    assert [(o, n.heading) for o, n in changes.modified] == [(deep, 'deep2')]
+    assert [o.heading for o in org.iterate()] == ['deep2', 'deeper', 'a']
+    assert org.children[1] is a
+    assert org.body == 'intro'
+
+
+def test_reload(tmp_path: Path):
+    f = tmp_path / 'journal.org'
+    f.write_text('* day 1\n')
+    org = Org.from_file(f)
+    day1 = org.children[0]
+    with f.open('a') as fo:
+        fo.write('* day 2\n')
+    changes = org.reload()
+    assert [n.heading for n in changes.added] == ['day 2']
+    assert org.children[0] is day1
+
+
+def test_iter_file(tmp_path: Path):
+    f = tmp_path / 'log.org'
+    f.write_text('''
+#+FILETAGS: :log:
+#+TODO: TODO WAIT | DONE
+* WAIT entry 1 :a:
+text
+** child
+* entry 2
+* entry 3
+more text
+'''.lstrip())
+    entries = Org.iter_file(f, chunk_size=7)
+    e1 = next(entries)
+    assert e1.heading == 'entry 1'
+    assert e1.node.todo == 'WAIT'
+    assert e1.tags == {'log', 'a'}
+    assert [c.tags for c in e1.children] == [{'log', 'a'}]
+    assert e1.get_raw(recursive=True) == 'text\n** child'
+
+    rest = list(entries)
+    assert [e.heading for e in rest] == ['entry 2', 'entry 3']
+    assert rest[1].body == 'more text'
+
+    full = Org.from_file(f)
+    for chunk_size in (1, 5, 1 << 20):
+        assert [e.get_raw(heading=True, recursive=True) for e in Org.iter_file(f, chunk_size=chunk_size)] \
+            == [e.get_raw(heading=True, recursive=True) for e in full.children]
+
+
+def test_spans(tmp_path: Path):
+    f = tmp_path / 'test.org'
+    f.write_text(ORG.lstrip() + '* ünïcode\n  :PROPERTIES:\n  :CREATED: [2019-01-01]\n  :END:\nbody\n')
+    data = f.read_bytes()
+    lines = data.decode('utf8').splitlines()
+
+    org = Org.from_file(f)
+    for o in org.iterate():
+        sp = o.span
+        assert lines[sp.start_line: sp.end_line] == o.node._lines
+        assert data[sp.start: sp.end].decode('utf8') == '\n'.join(o.node._lines) + '\n'
+        assert o.linenumber == o.node.linenumber
+    hello = find(org, 'Hello')
+    assert hello.subtree_span == (3, 9, len('somthing on top...\n\n\n'), len('somthing on top...\n\n\n* Hello\n** something\n :PROPERTIES:\n :CREATED: [2018-10-23 Tue 20:55]\n :END:\n\n'))
+    assert hello.body_span.start_line == 4
+    assert org.subtree_span.end == len(data)
+
+    # spans follow updates
+    org.update_from_string('* new\n' + f.read_text())
+    assert find(org, 'Hello').span.start_line == 4
+
+
+def test_mmap(tmp_path: Path):
+    for name in ['test.org', 'org-brain-readme.org', 'sublime_text2_shortcuts.org']:
+        f = tmp_path / name
+        f.write_bytes((Path(__file__).parent / 'data' / name).read_bytes())
+        org = Org.from_file(f)
+        morg = Org.from_file(f, mmap=True)
+        assert morg._tree.buffer is not None
+
+        assert morg.body == org.body
+        assert morg.get_raw(recursive=True) == org.get_raw(recursive=True)
+        for o, mo in zip(org.iterate(), morg.iterate()):
+            for heading in (True, False):
+                for recursive in (True, False):
+                    assert mo.get_raw(heading=heading, recursive=recursive) == o.get_raw(heading=heading, recursive=recursive)
+            assert mo.body == o.body
+        assert bytes(morg.children[0].raw_bytes(heading=True)) == org.children[0].get_raw(heading=True).encode('utf8')
+
+    f = tmp_path / 'crlf.org'
+    f.write_bytes(b'* a\r\nb\r\n')
+    org = Org.from_file(f, mmap=True)
+    assert org._tree.buffer is None # falls back on joining lines
+    assert org.children[0].body == 'b'
+
+    f.write_text('* a\nb\n* c\n')
+    org = Org.from_file(f, mmap=True)
+    with f.open('a') as fo:
+        fo.write('d\n')
+    org.reload()
+    assert org._tree.buffer is not None
+    assert org.children[1].get_raw(heading=True) == '* c\nd'
+
+
+def test_mmap_changed(tmp_path: Path):
+    import os
+    import subprocess
+    import sys
+    # reading a truncated mapping is a SIGBUS, so in a separate process to keep the test run alive if it regresses
+    f = tmp_path / 'log.org'
+    f.write_text('* a\n' + 'text\n' * 5000 + '* b\nmore\n')
+    script = '''
+import sys
+from pathlib import Path
+from porg import Org
+f = Path(sys.argv[1])
+org = Org.from_file(f, mmap=True)
+assert org._tree.buffer is not None
+f.write_text('* x\\n')
+assert org.children[1].get_raw(heading=True) == '* b\\nmore'
+assert org._tree.buffer is None
+'''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    res = subprocess.run([sys.executable, '-c', script, str(f)], env=env, stderr=subprocess.PIPE)
+    assert res.returncode == 0, res.stderr.decode('utf8')
+
+    # same size, edited in place
+    f.write_text('* a\nb\n')
+    org = Org.from_file(f, mmap=True)
+    f.write_text('* c\nd\n')
+    st = f.stat()
+    os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert org.children[0].get_raw(heading=True) == '* a\nb'
+
+
+def test_iter_file_spans(tmp_path: Path):
+    f = tmp_path / 'log.org'
+    f.write_text('#+FILETAGS: :log:\n* entry 1\ntext\n** child\n* entry 2\n')
+    full = Org.from_file(f)
+    assert [e.subtree_span for e in Org.iter_file(f)] == [e.subtree_span for e in full.children]
+
+    # entries before the first top level heading
+    f.write_text('#+FILETAGS: :log:\n** deep\ntext\n* a\n')
+    full = Org.from_file(f)
+    entries = list(Org.iter_file(f))
+    assert [(e.heading, e.tags) for e in entries] == [('deep', {'log'}), ('a', {'log'})]
+    assert entries[1].subtree_span.start_line == 3
+    assert [e.subtree_span for e in entries] == [e.subtree_span for e in full.children]
+
+
+def _reference_parse_org_date(s: str):
+    # the strptime based implementation parse_org_date used to have
+    from datetime import date
+    s = s.strip().strip('[]').strip()
+    for fmt, cl in [
+            ("%Y-%m-%d %a %H:%M", datetime),
+            ("%Y-%m-%d %H:%M", datetime),
+            ("%Y-%m-%d %a", date),
+            ("%Y-%m-%d", date),
+    ]:
+        try:
+            res = datetime.strptime(s, fmt)
+            if cl == date:
+                return res.date()
+            else:
+                return res
+        except ValueError:
+            continue
+    else:
+        raise RuntimeError(f"Bad date string {str(s)}")
+
+
+def test_parse_org_date():
+    from itertools import product
+    from porg import parse_org_date, parse_org_dates
+
+    days  = ['2018-10-23', '2018-1-2', '2019-02-30', '2019-12-31', '2019-13-01', '2019-01- 5', '0000-01-01', '201-01-01', '2019-01-032']
+    wdays = ['', ' Tue', ' tue', ' TUE', '  Fri  ', ' Tuesday', ' Xyz', ' Вт']
+    times = ['', ' 20:55', ' 8:05', ' 08:5', ' 24:00', ' 23:60', ' 20:55:11', ' 2055']
+    wraps = ['{}', '[{}]', ' [ {} ] ', '<{}>']
+    cases = [w.format(d + wd + t) for d, wd, t in product(days, wdays, times) for w in wraps]
+    cases.extend(['', '[]', 'garbage', '2018-10-23 Tue 20:55 +1w'])
+
+    for c in cases:
+        try:
+            expected = _reference_parse_org_date(c)
+        except RuntimeError:
+            with pytest.raises(RuntimeError):
+                parse_org_date(c)
+            continue
+        res = parse_org_date(c)
+        assert (type(res), res) == (type(expected), expected), c
+
+    assert parse_org_dates(['[2018-10-23 Tue 20:55]', '2018-10-23']) == [datetime(2018, 10, 23, 20, 55), datetime(2018, 10, 23).date()]
+
+
+def test_custom_date_format(monkeypatch):
+    import porg
+    from porg import parse_org_date, register_date_format
+    monkeypatch.setattr(porg, '_CUSTOM_DATE_FORMATS', [])
+
+    with pytest.raises(RuntimeError):
+        parse_org_date('23.10.2018 20:55')
+    register_date_format('%d.%m.%Y %H:%M')
+    assert parse_org_date('[23.10.2018 20:55]') == datetime(2018, 10, 23, 20, 55)
+    porg._parse_org_date.cache_clear()
+
+
+def test_blocks():
+    org = Org.from_string("""
+* item
+text
+:LOGBOOK:
+CLOCK: [2018-01-24 Wed 19:20]--[2018-01-24 Wed 21:00] =>  1:40
+:END:
+- a
+  continued
+- b
+| x | y |
+|---+---|
+| 1 | 2 |
+#+BEGIN_SRC python
+| not | a table |
+#+END_SRC
+more text
+:UNTERMINATED:
+""")
+    item = org.children[0]
+    assert [b.kind for b in item.blocks] == ['text', 'drawer', 'list', 'table', 'src', 'text']
+    assert item.blocks is item.blocks
+    assert item.blocks[-1].lines == ['more text', ':UNTERMINATED:']
+
+    [table] = item.tables
+    assert table._cols is None # not parsed until accessed
+    assert table.columns == ['x', 'y']
+    assert item.contents[-6] is table
+    assert '| not | a table |' in item.contents
+
+
+def test_table_columns():
+    org = Org.from_string("""
+| date             | value | comment |
+|------------------+-------+---------|
+| [2019-01-01 Tue] |   1.5 | a       |
+| [2019-01-02 Wed] |       | b       |
+| [2019-01-03 Thu] |     3 |         |
+""")
+    [t] = org.tables
+    assert t.columns == ['date', 'value', 'comment']
+    assert len(t.table) == 3
+    assert t.table[1] == {'date': '[2019-01-02 Wed]', 'value': '', 'comment': 'b'}
+    assert t.table == list(t.lines)
+    assert t[(2, 'comment')] == ''
+
+    assert t.column('comment') == ['a', 'b', '']
+    assert t.column('value', float) == [1.5, None, 3.0]
+    assert t.column('date', 'date')[0] == datetime(2019, 1, 1).date()
+
+    arr = t.column_array('value')
+    assert arr.typecode == 'd' and arr[0] == 1.5
+
+    # integer typecodes have no nan, empty cells need a fill value
+    [ints] = Org.from_string('| n |\n|---|\n| 1 |\n|   |\n| 3 |').tables
+    with pytest.raises(RuntimeError, match="'n' has empty cells"):
+        ints.column_array('n', 'q')
+    assert list(ints.column_array('n', 'q', fill=-1)) == [1, -1, 3]
+    assert list(t.column_array('value', fill=0.0)) == [1.5, 0.0, 3.0]
+
+    np = pytest.importorskip('numpy')
+    values = t.to_numpy('value')
+    assert np.shares_memory(values, np.frombuffer(arr, dtype='float64'))
+    assert values[0] == 1.5 and np.isnan(values[1])
+    dates = t.to_numpy('date', dtype='datetime64[D]')
+    assert str(dates[2]) == '2019-01-03'
+    assert list(ints.to_numpy('n', 'int64', fill=0)) == [1, 0, 3]
+    half = t.to_numpy('value', 'float16')
+    assert half.dtype == np.float16 and half[0] == 1.5 and np.isnan(half[1])
+    assert list(t.to_numpy('comment', 'U')) == ['a', 'b', '']
+    with pytest.raises(RuntimeError, match='Unsupported dtype bool'):
+        t.to_numpy('value', 'bool')
+
+
+def test_table_lazy(monkeypatch):
+    import porg
+    def fail(lines):
+        raise AssertionError("shouldn't parse the whole table")
+
+    org = Org.from_string("""
+| (id) |      |
+| name | kind |
+|------+------|
+| a    | x    |
+| b    |
+|------+------|
+| c    | z    | extra |
+""")
+    [t] = org.tables
+    monkeypatch.setattr(porg, '_parse_org_table', fail)
+    assert t.header == [['(id)', ''], ['name', 'kind']]
+    assert t.columns == ['name', 'kind']
+    assert t[(2, 'name')] == 'c'
+    assert t.table[1] == {'name': 'b', 'kind': ''}
+    assert t.table[-1] == {'name': 'c', 'kind': 'z'}
+    assert next(t.lines) == {'name': 'a', 'kind': 'x'}
+    assert t._cols is None
+    monkeypatch.undo()
+    assert t.column('kind') == ['x', '', 'z']
+
+    # no header: columns are named like org-mode column references
+    for text in ['| 1 | 2 |\n| 3 | 4 |', '|---+---|\n| 1 | 2 |\n| 3 | 4 |']:
+        [t] = Org.from_string(text).tables
+        assert t.header == []
+        assert t.columns == ['$1', '$2']
+        assert t.table == [{'$1': '1', '$2': '2'}, {'$1': '3', '$2': '4'}]
+        assert t.column('$2', int) == [2, 4]
+
+    # header only
+    for text in ['| a | b |\n|---+---|', '| x | y |\n| a | b |\n|---+---|']:
+        [t] = Org.from_string(text).tables
+        assert t.columns == ['a', 'b']
+        assert t.table == []
+        assert t.column('b') == []
+
+
+def test_generate_org():
+    from bench_porg import generate_org
+    text = generate_org(nodes=200, depth=3, seed=1)
+    assert text == generate_org(nodes=200, depth=3, seed=1)
+    assert text != generate_org(nodes=200, depth=3, seed=2)
+
+    org = Org.from_string(text)
+    nodes = list(org.iterate())
+    assert len(nodes) == 200
+    assert max(o.level for o in nodes) == 3
+    assert any(o.created is not None for o in nodes)
+    assert any(len(o.tables) > 0 for o in nodes)
+
+
+def test_query_cache():
+    from porg.query import has_tag, heading_contains
+    org = Org.from_string(ORG)
+    assert org.query_cache_stats is None
+    org.enable_query_cache(size=2)
+    stats = org.query_cache_stats
+
+    res = org.with_tag('kindle')
+    assert org.with_tag('kindle') == res
+    assert (stats.hits, stats.misses) == (1, 1)
+    res.clear() # callers get copies
+    assert len(org.with_tag('kindle')) > 0
+
+    # Pred are keyed by description, so a fresh but equivalent one hits
+    assert org.query(has_tag('kindle')) == org.query(has_tag('kindle'))
+    assert (stats.hits, stats.misses) == (3, 2)
+
+    # results from non-root nodes are separate
+    child = org.children[0]
+    assert child.query(has_tag('kindle')) == []
+    assert stats.misses == 3
+
+    # lru: with_tag was evicted, query(has_tag) wasn't
+    org.query(has_tag('kindle'))
+    assert stats.misses == 3
+    org.with_tag('kindle')
+    assert stats.misses == 4
+
+    org.invalidate_query_cache()
+    org.with_tag('kindle')
+    assert stats.misses == 5
+
+    # updates bump the tree version
+    before = org.query(heading_contains('new heading'))
+    assert before == []
+    org.update_from_string(ORG + '\n* new heading\n')
+    [new] = org.query(heading_contains('new heading'))
+    assert new.heading == 'new heading'
+
+    org.enable_xml_cache()
+    org.xpath_all('//org[heading="new heading"]')
+    assert org.xpath_all('//org[heading="new heading"]') == [new]
+    assert org.xml_cache_stats.misses == 1 # second one didn't get to the XML at all
+
+    org.disable_query_cache()
+    assert org.query_cache_stats is None
+
+
+def test_compile_query():
+    from porg import compile_query, CompiledQuery
+    q = compile_query('//org[heading="etc"]')
+    assert isinstance(q, CompiledQuery)
+    assert q.fields == {'heading', 'children'}
+
+    with pytest.raises(RuntimeError, match='Bad xpath'):
+        compile_query('//org[')
+
+    # not tied to a particular tree
+    trees = [Org.from_string(ORG, xml_cache=True) for _ in range(2)]
+    for org in trees:
+        [res] = org.xpath_all(q)
+        assert res.heading == 'etc'
+        assert res._root is org
+        assert q(org) == [res]
+        assert org.xpath(q) is res
+
+
+def test_async(tmp_path: Path):
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    paths = []
+    for i in range(3):
+        p = tmp_path / f'{i}.org'
+        p.write_text(ORG)
+        paths.append(p)
+
+    async def run():
+        with ThreadPoolExecutor(2) as pool:
+            trees = await asyncio.gather(*(Org.afrom_file(p, executor=pool, xml_cache=True) for p in paths))
+            assert [t._tree.source for t in trees] == paths
+
+            results = await asyncio.gather(*(t.axpath_all('//org[heading="etc"]') for t in trees))
+            assert [r.heading for [r] in results] == ['etc'] * 3
+            assert [r._root for [r] in results] == trees
+
+            # same tree from several threads
+            org = trees[0]
+            same = await asyncio.gather(*(org.axpath_all('//org[heading="etc"]', executor=pool) for _ in range(4)))
+            assert all(s == same[0] for s in same)
+
+            nodes = [o async for o in org.aiterate(executor=pool, batch_size=3)]
+            assert nodes == list(org.iterate())
+            assert [o async for o in org.aiterate(depth=1)] == org.children
+
+        with ProcessPoolExecutor(1) as pool:
+            org = await Org.afrom_file(paths[0], executor=pool)
+            assert org.children[0].heading == trees[0].children[0].heading
+            with pytest.raises(RuntimeError):
+                await org.axpath_all('//org', executor=pool)
+            with pytest.raises(RuntimeError):
+                await Org.afrom_file(paths[0], executor=pool, mmap=True)
+
+    asyncio.run(run())
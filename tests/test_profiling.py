@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+import logging
+
+from porg import Org
+from porg.profiling import Profile
+from porg.query import created_after
+
+from datetime import datetime
+
+
+ORG = """
+* [2019-01-01 Tue 10:00] first :a:
+| x | y |
+|---+---|
+| 1 | 2 |
+* second :b:
+:PROPERTIES:
+:CREATED: [2019-02-01 Fri 12:00]
+:END:
+** third :a:
+"""
+
+
+def test_disabled():
+    org = Org.from_string(ORG)
+    assert org.profile is None
+    assert len(org.with_tag('a')) == 2
+    assert org.children[1].profile is None
+
+
+def test_profile(caplog):
+    org = Org.from_string(ORG, profile=True)
+    prof = org.profile
+    assert isinstance(prof, Profile)
+    assert org.children[0].profile is prof
+    assert prof.phases['parse'].calls == 1
+
+    assert len(org.with_tag('a')) == 2
+    assert len(org.query(created_after(datetime(2019, 1, 15)))) == 1
+    assert prof.phases['query'].calls == 2
+    assert prof.phases['date_parse'].calls == 2 # third doesn't have a date
+
+    [t] = org.children[0].tables
+    assert t.column('y', int) == [2]
+    assert prof.phases['table_parse'].calls == 1
+    assert prof.phases['serialize'].calls == 0
+
+    org.update_from_string(ORG + '* fourth\n')
+    assert prof.phases['parse'].calls == 2
+    assert all(st.total >= 0 for st in prof.phases.values())
+    assert set(prof.as_dict()['query'].keys()) == {'calls', 'total'}
+
+    with caplog.at_level(logging.INFO, logger='porg'):
+        assert org.disable_profiling() is prof
+    assert org.profile is None
+    assert any('query' in r.getMessage() for r in caplog.records)
+    assert not any('serialize' in r.getMessage() for r in caplog.records) # no calls, not logged
+
+    prof.reset()
+    assert prof.phases['parse'].calls == 0
+
+
+def test_enable_later():
+    org = Org.from_string(ORG)
+    prof = org.children[1].enable_profiling()
+    assert org.enable_profiling() is prof
+    assert prof.phases['parse'].calls == 0
+
+    org.enable_xml_cache()
+    org.xpath_all('//org[heading="second"]')
+    assert prof.phases['serialize'].calls == 1
+    assert prof.phases['query'].calls == 1
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+from pathlib import Path
+
+from porg import Org
+from porg.corpus import OrgCorpus
+from porg.search import SearchIndex, tokenize
+
+
+ORG = """
+* python notes
+asyncio and threads
+** profiling python
+cProfile, py-spy
+* shopping list
+milk, bread
+* reading
+a book about Pythonic code
+"""
+
+
+def test_tokenize():
+    assert tokenize('Hello, py-spy! 2019-01-01') == ['hello', 'py', 'spy', '2019', '01', '01']
+
+
+def test_search():
+    org = Org.from_string(ORG)
+    index = org.search_index
+    assert org.search_index is index
+    assert len(index) == 4
+
+    # heading matches rank higher
+    res = org.search('python')
+    assert [r.org.heading for r in res] == ['python notes', 'profiling python']
+    assert res[0].score > 0
+
+    assert {r.org.heading for r in org.search('python*')} == {'python notes', 'profiling python', 'reading'}
+    assert [r.org.heading for r in org.search('pyth', prefix=True)] == [r.org.heading for r in org.search('pyth*')]
+    assert org.search('nothing here') == []
+    assert len(org.search('python*', limit=1)) == 1
+
+    # OR semantics, nodes matching more terms first
+    assert org.search('milk asyncio python')[0].org.heading == 'python notes'
+
+    # scoped to the subtree
+    notes = org.children[0]
+    assert [r.org.heading for r in notes.search('python*')] == ['python notes', 'profiling python']
+    assert [r.org.heading for r in org.children[2].search('python*')] == ['reading']
+
+
+def test_search_update():
+    org = Org.from_string(ORG)
+    index = org.search_index
+    assert org.search('milk')[0].org.heading == 'shopping list'
+
+    changes = org.update_from_string(ORG.replace('milk', 'cheese') + '* milkshake recipes\n')
+    assert changes
+    assert org.search_index is index # updated in place
+    assert [r.org.heading for r in org.search('milk')] == []
+    assert [r.org.heading for r in org.search('milk*')] == ['milkshake recipes']
+    assert org.search('cheese')[0].org.heading == 'shopping list'
+    assert len(index) == 5
+
+    # removals
+    org.update_from_string('* only this\n')
+    assert len(index) == 1
+    assert org.search('python*') == []
+
+    # standalone index, nodes changed in place
+    idx = SearchIndex.from_org(Org.from_string(ORG))
+    [r] = idx.search('bread')
+    idx.remove_node(r.org)
+    assert idx.search('bread') == []
+    idx.add_node(r.org)
+    assert idx.search('bread')[0].org is r.org
+
+
+def test_search_detached(tmp_path: Path):
+    # iter_file entries and removed nodes aren't in the root's index, they get their own
+    f = tmp_path / 'notes.org'
+    f.write_text(ORG)
+    entry = next(Org.iter_file(f))
+    assert [r.org.heading for r in entry.search('python')] == ['python notes', 'profiling python']
+    assert [r.org.heading for r in entry.children[0].search('python')] == ['profiling python']
+    assert [o.heading for o in entry.with_tag('nope')] == []
+
+    org = Org.from_string(ORG)
+    notes = org.children[0]
+    assert len(notes.search('python')) == 2
+    org.update_from_string('* other\n')
+    assert [r.org.heading for r in notes.search('python')] == ['python notes', 'profiling python']
+    assert org.search('python') == []
+
+
+def test_corpus_search(tmp_path: Path):
+    (tmp_path / 'a.org').write_text(ORG)
+    (tmp_path / 'b.org').write_text('* more python\n')
+    corpus = OrgCorpus(tmp_path, workers=0)
+    hits = corpus.search('python', limit=None)
+    assert {(h.path.name, h.org.heading) for h in hits} == {('a.org', 'python notes'), ('a.org', 'profiling python'), ('b.org', 'more python')}
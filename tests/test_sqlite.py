@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+from datetime import datetime
+import os
+from pathlib import Path
+
+from porg.sqlite import OrgDB
+
+import pytest
+
+
+def test_index_search(tmp_path: Path, notes: Path):
+    with OrgDB(tmp_path / 'db.sqlite') as db:
+        (updated, removed) = db.index_dir(notes)
+        assert len(updated) == 2 and removed == []
+        assert len(db) == 4
+
+        [hit] = db.search('asyncio')
+        assert hit.heading == 'notes'
+        assert hit.path == (notes / 'a.org').resolve()
+        assert hit.tags == {'work', 'todo'}
+        assert hit.self_tags == {'todo'}
+        assert hit.linenumber == 5
+        assert hit.body == 'asyncio questions'
+        assert hit.parent.heading == 'meeting about python'
+        assert [c.heading for c in hit.parent.children] == ['notes']
+
+        # prefix queries, ranked
+        assert {h.heading for h in db.search('python*')} == {'meeting about python', 'shopping'}
+        assert [h.heading for h in db.search('python*', limit=1)] == [db.search('python*')[0].heading]
+        assert [h.heading for h in db.search('heading: python')] == ['meeting about python']
+        with pytest.raises(RuntimeError):
+            db.search('"unterminated')
+
+        assert [h.heading for h in db.with_tag('todo')] == ['notes', 'shopping']
+        assert [h.heading for h in db.with_tag('work', with_inherited=False)] == []
+        [feb] = db.created_between(datetime(2019, 1, 15), datetime(2019, 3, 1))
+        assert feb.created == datetime(2019, 2, 1, 12, 0)
+        assert feb.properties == {'CREATED': '[2019-02-01 Fri 12:00]'}
+
+        # subtree is only parsed when asked for, with the file settings
+        org = hit.org
+        assert org.heading == 'notes'
+        assert org.node.todo == 'WAIT'
+        assert org.get_raw(heading=True) == '** WAIT notes :todo:\nasyncio questions'
+
+        meeting = hit.parent.org
+        assert [c.heading for c in meeting.children] == ['notes']
+
+
+def test_incremental(tmp_path: Path, notes: Path):
+    dbpath = tmp_path / 'db.sqlite'
+    with OrgDB(dbpath) as db:
+        db.index_dir(notes)
+        [hit] = db.search('milk')
+
+        b = notes / 'sub' / 'b.org'
+        b.write_text(b.read_text() + '* bread :todo:\n')
+        st = b.stat()
+        os.utime(b, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        with pytest.raises(RuntimeError, match='changed since'):
+            hit.org
+
+    with OrgDB(dbpath) as db: # persisted
+        assert len(db) == 4
+        (updated, removed) = db.index_dir(notes)
+        assert updated == [b.resolve()]
+        assert len(db) == 5
+        assert [h.heading for h in db.with_tag('todo')] == ['notes', 'shopping', 'bread']
+        assert db.search('milk')[0].org.heading == 'shopping'
+
+        (notes / 'a.org').unlink()
+        (updated, removed) = db.index_dir(notes)
+        assert (updated, removed) == ([], [(notes / 'a.org').resolve()])
+        assert db.files == [b.resolve()]
+        assert db.search('asyncio') == []
+        assert db.query('n.level = ?', (1,))[0].heading == 'shopping'
+
+
+def test_created_roundtrip(tmp_path: Path, notes: Path, monkeypatch):
+    from datetime import timedelta, timezone
+    import porg
+    from porg.sqlite import _parse_created, _strptime_isoformat
+
+    for d in [
+            datetime(2019, 3, 1, 10, 0),
+            datetime(2019, 3, 1, 10, 0, 0, 250000),
+            datetime(2019, 3, 1, 10, 0, tzinfo=timezone(timedelta(hours=5, minutes=30))),
+            datetime(2019, 3, 1, 10, 0, 0, 1, tzinfo=timezone.utc),
+    ]:
+        assert _parse_created(d.isoformat()) == d
+        assert _strptime_isoformat(d.isoformat()) == d
+    assert _parse_created('2019-03-01') == datetime(2019, 3, 1).date()
+
+    monkeypatch.setattr(porg, '_CUSTOM_DATE_FORMATS', [])
+    porg.register_date_format('%Y-%m-%d %H:%M:%S.%f')
+    try:
+        (notes / 'c.org').write_text('* precise\n:PROPERTIES:\n:CREATED: [2019-03-01 10:00:00.250000]\n:END:\n')
+        with OrgDB(tmp_path / 'db.sqlite') as db:
+            db.index_dir(notes)
+            [hit] = db.search('precise')
+            assert hit.created == datetime(2019, 3, 1, 10, 0, 0, 250000)
+    finally:
+        porg._parse_org_date.cache_clear()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+from datetime import datetime
+
+from porg import Org
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+
+ORG = """
+* [2019-01-01 Tue 10:00] first
+SCHEDULED: <2019-01-02 Wed> DEADLINE: <2019-01-05 Sat 10:00>
+:LOGBOOK:
+CLOCK: [2019-01-01 Tue 10:00]--[2019-01-01 Tue 11:30] =>  1:30
+CLOCK: [2019-01-03 Thu 09:00]
+:END:
+** child
+:PROPERTIES:
+:CREATED: [2018-12-30 Sun 12:00]
+:END:
+* no timestamps
+"""
+
+
+def test_timeline():
+    org = Org.from_string(ORG)
+    tl = org.timeline()
+    assert len(tl) == 6
+    assert len(tl.nodes) == 3
+    assert tl.time.dtype == np.dtype('datetime64[m]')
+    assert [tl.kind_of(i) for i in range(len(tl))] == ['created', 'scheduled', 'deadline', 'clock', 'clock', 'created']
+    assert list(tl.node) == [0, 0, 0, 0, 0, 1]
+    assert list(tl.level) == [1, 1, 1, 1, 1, 2]
+    assert tl.org(5).heading == 'child'
+
+    clock = tl.of_kind('clock')
+    assert clock.durations[0] == np.timedelta64(90, 'm')
+    assert np.isnat(clock.end[1])
+
+    jan = tl.between(datetime(2019, 1, 1), datetime(2019, 1, 3))
+    assert [str(t) for t in jan.sorted().time] == ['2019-01-01T10:00', '2019-01-01T10:00', '2019-01-02T00:00']
+
+    created = org.timeline(kinds=['created'])
+    assert [str(t) for t in created.time] == ['2019-01-01T10:00', '2018-12-30T12:00']
+
+    # vectorized per-day counts
+    days, counts = np.unique(tl.time.astype('datetime64[D]'), return_counts=True)
+    assert dict(zip(map(str, days), counts)) == {'2018-12-30': 1, '2019-01-01': 2, '2019-01-02': 1, '2019-01-03': 1, '2019-01-05': 1}
+
+    empty = Org.from_string('* nothing').timeline()
+    assert len(empty) == 0 and empty.time.dtype == np.dtype('datetime64[m]')
+
+    with pytest.raises(RuntimeError):
+        org.timeline(kinds=['closed'])